@@ -1,6 +1,4 @@
 import os
-import io
-import zipfile
 from typing import List, Optional, Tuple
 from pathlib import Path
 
@@ -9,7 +7,7 @@ import pandas as pd
 from PIL import Image
 from datetime import datetime
 
-from preprocessing.pdf_utils import convert_pdf_to_images
+from preprocessing.pdf_utils import iter_pdf_pages
 from preprocessing.image_utils import (
     convert_pil_to_cv,
     convert_cv_to_pil,
@@ -17,6 +15,7 @@ from preprocessing.image_utils import (
     detect_and_crop_table_region,
 )
 from processing.ocr_processor import OCRProcessor
+from storage.zipstream import iter_zip
 from config import PREPROCESSING, APP_NAME, DATA_DIR
 
 
@@ -70,14 +69,13 @@ def sidebar_settings() -> dict:
 
 
 def save_images_to_zip(images: List[Image.Image]) -> bytes:
-	buffer = io.BytesIO()
-	with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zipf:
-		for idx, img in enumerate(images, start=1):
-			img_bytes = io.BytesIO()
-			img.save(img_bytes, format="PNG")
-			zipf.writestr(f"cleaned_page_{idx:02d}.png", img_bytes.getvalue())
-	buffer.seek(0)
-	return buffer.read()
+	# Each page is encoded straight into its (stored, not deflated) archive entry;
+	# st.download_button needs the whole archive, so the streamed pieces are joined here
+	entries = (
+		(f"cleaned_page_{idx:02d}.png", lambda dest, img=img: img.save(dest, format="PNG"))
+		for idx, img in enumerate(images, start=1)
+	)
+	return b"".join(iter_zip(entries))
 
 
 def main() -> None:
@@ -110,8 +108,7 @@ def main() -> None:
 			all_input_images: List[Image.Image] = []
 			with st.spinner("Reading files..."):
 					if up.type == "application/pdf" or up.name.lower().endswith(".pdf"):
-						images = convert_pdf_to_images(up.read())
-						all_input_images.extend(images)
+						all_input_images.extend(iter_pdf_pages(up.read(), target_width=settings["resize_width"]))
 					else:
 						img = Image.open(up).convert("RGB")
 						all_input_images.append(img)
@@ -0,0 +1,196 @@
+"""
+Load-test the OCR path offline against the mock Gemini server (or Tesseract).
+
+Every page goes through the same code as /ocr-batch: upload encoding, the
+pooled retrying client, optional multi-page batches and TSV parsing. Only the
+API is replaced. The result cache is bypassed.
+
+--compare-upload MODE[:MAX_SIDE[:FORMAT]] instead reads every page twice, as
+the original file and re-encoded as OCR_UPLOAD would send it, and reports how
+many parsed cells differ. Use it with real scans (--image) and the gemini
+backend (GEMINI_API_KEY, billed) or local before changing OCR_UPLOAD; the mock
+answers the same rows whatever the image.
+
+Usage:
+    python bench_ocr.py [--pages 40] [--concurrency 1,4,8] [--latency 1.5] [--error-rate 0.05] [--batch-size 1]
+    python bench_ocr.py --concurrency 16 --error-rate 0.1 --limit --rpm 120
+    python bench_ocr.py --backend local --image scan.png
+    python bench_ocr.py --backend gemini --image scan.png --pages 5 --concurrency 2 --compare-upload gray:2400
+"""
+import argparse
+import csv
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from config import OCR_UPLOAD
+from gemini import gemini_ocr_extract, gemini_ocr_extract_batch
+from ocr.backends import GeminiBackend, LocalOCRBackend, MockGeminiBackend
+from ocr.client import GeminiClient
+from ocr.encoding import FORMATS, encode_for_upload
+from ocr.ratelimit import AIMDController, RateLimiter
+
+
+def write_pages(directory: str, count: int, image: str = None) -> list:
+    """count distinct page images: copies of image with a pixel changed, or small synthetic pages."""
+    base = cv2.imread(image) if image else None
+    if image and base is None:
+        raise SystemExit(f"❌ Could not read {image}")
+    paths = []
+    for i in range(count):
+        if base is not None:
+            page = base.copy()
+        else:
+            page = np.full((1400, 1000), 230, np.uint8)
+            for y in range(100, 1300, 50):
+                cv2.putText(page, f"{y // 50} S{y:03d} STUDENT P P A P", (60, y), cv2.FONT_HERSHEY_SIMPLEX, 1.0, 30, 2)
+        page.flat[i % page.size] ^= 1  # Distinct bytes, so nothing is served from a cache
+        path = os.path.join(directory, f"page_{i + 1:03d}.png")
+        cv2.imwrite(path, page)
+        paths.append(path)
+    return paths
+
+
+def run(backend, paths: list, csv_dir: str, concurrency: int, batch_size: int) -> dict:
+    groups = [paths[i:i + batch_size] for i in range(0, len(paths), batch_size)]
+
+    def work(group):
+        csvs = [os.path.join(csv_dir, os.path.basename(p) + ".csv") for p in group]
+        if len(group) == 1:
+            return [gemini_ocr_extract(group[0], csv_path=csvs[0], use_cache=False, backend=backend)]
+        return gemini_ocr_extract_batch(group, csvs, use_cache=False, backend=backend)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outputs = [out for outs in executor.map(work, groups) for out in outs]
+    elapsed = time.perf_counter() - start
+    return dict(elapsed=elapsed, ok=sum(1 for o in outputs if o), failed=sum(1 for o in outputs if not o))
+
+
+def read_rows(csv_path: str) -> list:
+    if not csv_path or not os.path.isfile(csv_path):
+        return []
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        return list(csv.reader(f))[1:]
+
+
+def compare_rows(reference: list, candidate: list) -> tuple:
+    """(differing cells, cells) of candidate against reference, row by row; missing or extra rows differ entirely."""
+    width = max([len(r) for r in reference + candidate] or [0])
+    same = sum(a == b for r, c in zip(reference, candidate) for a, b in zip(r, c))
+    total = max(len(reference), len(candidate)) * width
+    return total - same, total
+
+
+def compare_upload(backend, paths: list, workdir: str, concurrency: int, spec: str) -> None:
+    mode, _, rest = spec.partition(":")
+    max_side, _, fmt = rest.partition(":")
+    upload = dict(OCR_UPLOAD, mode=mode, max_side=int(max_side or 0), format=fmt or OCR_UPLOAD.get("format", "png"))
+
+    # The re-encoded bytes are written out and read as files, so every backend sees exactly what would be uploaded
+    encoded_dir = os.path.join(workdir, "encoded")
+    os.makedirs(encoded_dir)
+    encoded = []
+    for path in paths:
+        data, _, _ = encode_for_upload(path, upload["mode"], upload["max_side"], upload["format"], upload.get("quality", 90))
+        encoded.append(os.path.join(encoded_dir, os.path.splitext(os.path.basename(path))[0] + FORMATS[upload["format"]][0]))
+        with open(encoded[-1], "wb") as f:
+            f.write(data)
+
+    def read_all(label: str, images: list) -> list:
+        csv_dir = os.path.join(workdir, label)
+        os.makedirs(csv_dir)
+
+        def work(image):
+            csv_path = os.path.join(csv_dir, os.path.basename(image) + ".csv")
+            return read_rows(gemini_ocr_extract(image, csv_path=csv_path, use_cache=False, backend=backend))
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            return list(executor.map(work, images))
+
+    saved = dict(OCR_UPLOAD)
+    OCR_UPLOAD.update(mode="original", max_side=0)  # Both sides are sent as the files they are
+    try:
+        reference = read_all("original", paths)
+        candidate = read_all("candidate", encoded)
+    finally:
+        OCR_UPLOAD.clear()
+        OCR_UPLOAD.update(saved)
+
+    before = sum(os.path.getsize(p) for p in paths)
+    after = sum(os.path.getsize(p) for p in encoded)
+    print(f"\n🧪 Upload {spec} against the original files: {before / 1048576:.1f} MB -> {after / 1048576:.1f} MB ({after / max(1, before):.2f}x)")
+    diff_total = cells_total = 0
+    for path, ref, cand in zip(paths, reference, candidate):
+        diff, cells = compare_rows(ref, cand)
+        diff_total += diff
+        cells_total += cells
+        print(f"   {os.path.basename(path)}: {len(ref)} rows -> {len(cand)} rows, {diff} of {cells} cells differ")
+    print(f"   overall: {diff_total} of {cells_total} cells differ ({diff_total / max(1, cells_total) * 100:.2f}%)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=["mock", "local", "gemini"], default="mock")
+    parser.add_argument("--image", help="Page to replicate (default: synthetic pages)")
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--concurrency", default="1,4,8", help="Comma-separated worker counts to compare")
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=1.5, help="Mock response time in seconds")
+    parser.add_argument("--jitter", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--retries", type=int, default=4)
+    parser.add_argument("--limit", action="store_true", help="Put an adaptive (AIMD) concurrency limit in front of the mock")
+    parser.add_argument("--rpm", type=float, default=0, help="Requests per minute allowed by the limiter (0 = unlimited)")
+    parser.add_argument("--compare-upload", metavar="MODE[:MAX_SIDE[:FORMAT]]", help="Diff parsed rows of original vs re-encoded uploads")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_ocr_")
+    try:
+        paths = write_pages(workdir, args.pages, args.image)
+        print(f"📄 {len(paths)} pages, backend {args.backend}, batch size {args.batch_size}")
+        if args.compare_upload:
+            backend = {"mock": MockGeminiBackend, "local": LocalOCRBackend, "gemini": GeminiBackend}[args.backend]()
+            compare_upload(backend, paths, workdir, int(args.concurrency.split(",")[0]), args.compare_upload)
+            return
+        for concurrency in [int(c) for c in args.concurrency.split(",") if c.strip()]:
+            if args.backend == "mock":
+                backend = MockGeminiBackend(
+                    latency_s=args.latency,
+                    latency_jitter_s=args.jitter,
+                    error_rate=args.error_rate,
+                    seed=0,
+                )
+                # A fresh client (and limiter) per run so the counters start at zero; short backoff keeps runs quick
+                limiter = None
+                if args.limit or args.rpm:
+                    limiter = RateLimiter(requests_per_min=args.rpm, concurrency=AIMDController(maximum=concurrency) if args.limit else None)
+                backend._client = GeminiClient(
+                    base_url=backend.server.base_url, max_retries=args.retries, backoff_base=0.2, backoff_max=2.0, limiter=limiter
+                )
+            elif args.backend == "gemini":
+                backend = GeminiBackend()
+            else:
+                backend = LocalOCRBackend()
+            result = run(backend, paths, workdir, concurrency, max(1, args.batch_size))
+            stats = backend.stats()
+            print(
+                f"\n🧪 {concurrency} workers: {result['elapsed']:.1f} s, {result['ok'] / result['elapsed']:.2f} pages/s, "
+                f"{result['ok']} ok, {result['failed']} failed"
+            )
+            print(f"   {stats}")
+            if args.backend == "mock" and backend.client.limiter is not None:
+                print(f"   limiter: {backend.client.limiter.stats()}")
+            if args.backend == "mock":
+                backend.server.stop()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,9 +8,10 @@ DATA_DIR = BASE_DIR / "data"
 OUTPUT_DIR = BASE_DIR / "outputs"
 STATIC_DIR = BASE_DIR / "static"
 RUNS_DIR = STATIC_DIR / "runs"
+CACHE_DIR = BASE_DIR / "cache"
 
 # Create directories
-for directory in [DATA_DIR, OUTPUT_DIR, RUNS_DIR]:
+for directory in [DATA_DIR, OUTPUT_DIR, RUNS_DIR, CACHE_DIR]:
     directory.mkdir(parents=True, exist_ok=True)
 
 # Application settings
@@ -26,9 +27,118 @@ PREPROCESSING = {
     "adaptive_c": 10,
     "clahe_clip": 2.0,
     "denoise_strength": 5,
+    "denoise_tile": 0,  # Tile size for threaded denoising; 0 = single-shot. Only faster with spare cores (see bench_preprocessing.py)
+    "denoise_workers": 0,  # Threads per page for tiled denoising; 0 = CPU cores / page workers (1 with a full process pool)
     "deskew": True,
+    "deskew_method": "minarea",  # "minarea" (full-resolution fit) or the faster "projection" (downsampled estimate)
+    "deskew_min_angle": 0.2,  # Skip the rotation below this many degrees
     "crop_table": False,  # Keep full image
+    "table_columns": None,  # Grid column indices kept when cropping (e.g. roll, name, attendance); None = all
+    "table_header_rows": 1,  # Grid rows skipped at the top of the table when cropping
     "remove_shadow": True,
+    # Resolution factor for the shadow background estimate; 1.0 = full resolution. 0.25 is the fast
+    # option: it differs from full resolution by mean |Δ| 0.01-0.05 but max |Δ| ~150, with 0.02-0.16%
+    # of pixels (around glyph edges) off by more than 8 grey levels (bench_preprocessing.py)
+    "shadow_scale": 1.0,
+    "profile": False,  # Record per-stage wall time and peak allocation for every page
+    "graph_max_bytes": 512 * 1024 * 1024,  # Intermediate arrays kept in memory for re-tuning, least recently tuned runs dropped first
+    "pdf_window": 1,  # PDF pages rasterized per poppler call while streaming
+    "pdf_extract_images": True,  # Use the embedded scan of single-image PDF pages instead of re-rendering
+    "workers": 0,  # Page worker processes for /process; 0 = one per CPU core, 1 = run in the request thread
+}
+
+# Cleaned-page cache keyed by input pixels + preprocessing settings
+PAGE_CACHE = {
+    "enabled": True,
+    "dir": CACHE_DIR / "pages",
+    "max_bytes": 512 * 1024 * 1024,  # LRU eviction above this size
+}
+
+# Background preprocessing jobs
+JOBS = {
+    "workers": 2,  # Runs processed at the same time; pages within a run still use PREPROCESSING["workers"]
+    "keep": 50,  # Finished runs whose status stays queryable
+}
+
+# Gemini OCR
+OCR = {
+    "backend": os.getenv("OCR_BACKEND", "gemini"),  # "gemini", "mock" (local stand-in for the API, see OCR_MOCK) or "local" (Tesseract)
+    "concurrency": 4,  # Pages sent to Gemini at the same time by /ocr-batch
+    "batch_size": 1,  # Pages packed into one generateContent call by /ocr-batch; 1 = one call per page
+    "batch_max_bytes": 18 * 1024 * 1024,  # Batches whose base64-encoded images are larger are sent page by page (the API caps requests at 20 MB)
+    "base_url": os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com"),  # Point at python -m ocr.mock_server to test offline
+    "connect_timeout_s": 10.0,
+    "read_timeout_s": 60.0,
+    "max_retries": 4,  # Extra attempts after a 429, 5xx, timeout or dropped connection
+    "backoff_base_s": 1.0,  # Retry n waits up to base * 2**n seconds (random, full jitter)...
+    "backoff_max_s": 30.0,  # ...but never more than this
+    "max_retry_after_s": 120.0,  # Upper bound on a server's Retry-After
+    "pool_size": 10,  # Keep-alive connections kept open to the API
+    "record_dir": None,  # Save every API response here for the mock backend to replay
+}
+
+# Client-side limits shared by every OCR request in the process (see ocr/ratelimit.py)
+OCR_LIMITS = {
+    "requests_per_min": 60,  # Token bucket for API requests (retries included); 0 = unlimited
+    "bytes_per_min": 100 * 1024 * 1024,  # Token bucket for request body bytes; 0 = unlimited
+    "burst_s": 10,  # Both buckets bank up to this many seconds of unused quota
+    "adaptive_concurrency": True,  # AIMD limit on requests in flight, on top of OCR["concurrency"] per run
+    "concurrency_initial": 4,
+    "concurrency_min": 1,
+    "concurrency_max": 16,
+    "concurrency_increase": 1.0,  # Added per limit's worth of successful requests
+    "concurrency_decrease": 0.5,  # Multiplied in on a 429 or 503
+}
+
+# "mock" OCR backend: an in-process HTTP server that answers like generateContent
+OCR_MOCK = {
+    "recordings_dir": DATA_DIR / "ocr_recordings",  # Responses saved with OCR["record_dir"]; canned rows if empty
+    "latency_s": 1.5,  # Per-request delay...
+    "latency_jitter_s": 1.0,  # ...plus up to this much at random
+    "error_rate": 0.0,  # Fraction of requests failed with one of error_statuses
+    "error_statuses": [429, 503],
+    "seed": None,
+}
+
+# "local" OCR backend
+OCR_LOCAL = {
+    "tesseract_cmd": "tesseract",
+    "lang": "eng",
+    "psm": 6,  # Page segmentation: a single uniform block of text
+}
+
+# How page images are re-encoded before upload (see ocr/encoding.py). Check a smaller encoding against
+# the originals with `python bench_ocr.py --backend gemini --image scan.png --compare-upload gray:2400` first
+OCR_UPLOAD = {
+    "mode": "original",  # "original" (file as is), "color", "gray" or "bilevel" (black and white)
+    "max_side": 0,  # Longer side in pixels after downscaling; 0 = full resolution
+    "format": "png",  # "png", "jpeg" or "webp"
+    "quality": 90,  # JPEG / WebP quality
+}
+
+# Parsed OCR results, keyed by image bytes + model + prompt
+OCR_CACHE = {
+    "enabled": True,
+    "path": CACHE_DIR / "ocr_results.db",
+    "ttl_days": 90,  # Entries older than this are read again; 0 = never expire
+    "max_bytes": 64 * 1024 * 1024,  # LRU eviction above this size (of stored rows)
+}
+
+# Run storage under static/runs
+STORAGE = {
+    "index_path": DATA_DIR / "runs.db",  # SQLite index of runs, pages and OCR artefacts
+    "retention": True,  # Sweep static/runs in the background with the limits below
+    "max_age_days": 30,  # Runs older than this are deleted; 0 = keep forever
+    "max_bytes": 2 * 1024 * 1024 * 1024,  # Oldest runs are deleted above this total; 0 = no quota
+    "compact_after_days": 3,  # Runs untouched this long are packed into <run_id>.zip; 0 = never
+    "sweep_interval_s": 3600,
+}
+
+# Pre-OCR page filter
+PAGE_FILTER = {
+    "enabled": True,
+    "blank_ink_density": 0.005,  # Pages with less ink than this fraction are treated as blank
+    "duplicate_max_distance": 24,  # Max differing bits (of 256) in the perceptual hash for a re-scan
 }
 
 # Attendance settings
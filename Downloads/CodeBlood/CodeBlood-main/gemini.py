@@ -1,13 +1,43 @@
 import os
-import base64
-import requests
+import hashlib
+import json
 import csv
 from typing import Optional, List
 from dotenv import load_dotenv
 
+from config import OCR_UPLOAD
+from ocr.backends import OCRBackend, OCRError, get_backend
+from ocr.cache import get_cache
+from ocr.prompts import BATCH_PROMPT, SYSTEM_PROMPT
+
 # Load environment variables
 load_dotenv()
 
+DEFAULT_MODEL = "gemini-2.5-flash"  # Fast, multimodal
+
+# Gemini rejects requests over 20 MB; compared with the base64-encoded size of the images
+BATCH_MAX_BYTES = 18 * 1024 * 1024
+
+
+def ocr_fingerprint(
+    image_path: str,
+    model: str = DEFAULT_MODEL,
+    prompt: str = SYSTEM_PROMPT,
+    upload: Optional[dict] = None
+) -> str:
+    """
+    Identity of an OCR result: the image bytes plus the model and prompt that read
+    them and the upload encoding (OCR_UPLOAD by default) they were sent with. A
+    stored CSV is only reusable while this is unchanged.
+    """
+    h = hashlib.sha256()
+    with open(image_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    h.update(b"\0" + model.encode("utf-8") + b"\0" + prompt.encode("utf-8"))
+    h.update(b"\0" + json.dumps(OCR_UPLOAD if upload is None else upload, sort_keys=True).encode("utf-8"))
+    return h.hexdigest()
+
 
 def _normalize_mark(cell: str) -> str:
     """
@@ -67,89 +97,83 @@ def _fix_columns(cols: List[str]) -> List[str]:
     return cols
 
 
+def parse_tsv(text: str) -> List[List[str]]:
+    """Split the model's TSV answer into rows of exactly 13 normalized columns."""
+    rows = []
+    for line in text.splitlines():
+        line = line.strip().strip('"')
+        if not line:
+            continue
+        rows.append(_fix_columns(line.split("\t")))
+    return rows
+
+
+def write_csv(rows: List[List[str]], csv_path: str) -> None:
+    header = ["Roll", "StudentID", "Name"] + [f"Att{i}" for i in range(1, 11)]
+    with open(csv_path, "w", newline="", encoding="utf-8") as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
 def gemini_ocr_extract(
     image_path: str,
     api_key: Optional[str] = None,
     csv_path: str = "attendance.csv",
-    model: str = "gemini-2.5-flash"  # Fast, multimodal
+    model: str = DEFAULT_MODEL,
+    use_cache: bool = True,
+    report: Optional[dict] = None,
+    backend: Optional[OCRBackend] = None
 ) -> str:
     """
     Extract text from an attendance sheet image using Google Gemini (multimodal)
     and export the result as a CSV file with normalized attendance.
+
+    The image is read by backend (config.OCR["backend"] by default: Gemini, the
+    local mock of its API, or Tesseract). Parsed rows are kept in the OCR result
+    cache, so the same image read by the same backend, model and prompt is
+    answered from disk. use_cache=False always reads the image again (and
+    refreshes the cached entry). Images sent to Gemini are re-encoded per
+    OCR_UPLOAD first; report, if given, receives the bytes before and after
+    (see encode_for_upload).
     """
+    backend = backend or get_backend()
+    cache = get_cache()
+    try:
+        key = ocr_fingerprint(image_path, backend.cache_id(model)) if cache is not None else None
+        if key is not None and use_cache:
+            rows = cache.get(key)
+            if rows:
+                write_csv(rows, csv_path)
+                print(f"✅ Attendance exported to {csv_path} (cached)")
+                return csv_path
+    except Exception as e:
+        print(f"⚠️ OCR cache unavailable: {e}")
+        key = None
+
     api_key = api_key or os.getenv("GEMINI_API_KEY")
-    if not api_key:
+    if backend.needs_api_key and not api_key:
         print("⚠️ No API key found. Set GEMINI_API_KEY env var or pass api_key arg.")
         return ""
 
     try:
-        with open(image_path, "rb") as f:
-            base64_image = base64.b64encode(f.read()).decode("utf-8")
-
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent?key={api_key}"
-        headers = {"Content-Type": "application/json"}
-
-        system_prompt = (
-            "Extract the attendance table as TSV with columns exactly: "
-            "Roll\tStudentID\tName\tAtt1\tAtt2\tAtt3\tAtt4\tAtt5\tAtt6\tAtt7\tAtt8\tAtt9\tAtt10. "
-            "Return only raw TSV content without code fences or explanations ."
-        )
-
-        # Determine MIME type from file extension (processed images may be PNG)
-        ext = os.path.splitext(image_path)[1].lower()
-        mime_type = "image/png" if ext == ".png" else "image/jpeg"
-
-        payload = {
-            "contents": [
-                {
-                    "role": "user",
-                    "parts": [
-                        {"text": system_prompt},
-                        {
-                            "inline_data": {
-                                "mime_type": mime_type,
-                                "data": base64_image
-                            }
-                        }
-                    ]
-                }
-            ]
-        }
-
-        resp = requests.post(url, headers=headers, json=payload, timeout=60)
-        if resp.status_code != 200:
-            print(f"❌ Gemini API Error: {resp.status_code}")
-            print(resp.text)
+        try:
+            text_output = backend.read_page(image_path, model, api_key, report)
+        except OCRError as e:
+            print(f"❌ {e}")
+            if e.detail:
+                print(e.detail)
             return ""
 
-        data = resp.json()
-        text_output = ""
-        for cand in data.get("candidates", []):
-            content = cand.get("content", {})
-            for part in content.get("parts", []):
-                if "text" in part:
-                    text_output += part["text"]
-
         if not text_output.strip():
             print("⚠️ No OCR result returned.")
             return ""
 
         # Parse TSV and normalize
-        rows = []
-        for line in text_output.splitlines():
-            line = line.strip().strip('"')
-            if not line:
-                continue
-            cols = line.split("\t")
-            fixed = _fix_columns(cols)
-            rows.append(fixed)
-
-        # Write header and rows
-        header = ["Roll", "StudentID", "Name"] + [f"Att{i}" for i in range(1, 11)]
-        with open(csv_path, "w", newline="", encoding="utf-8") as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow(header)
-            writer.writerows(rows)
+        rows = parse_tsv(text_output)
+        write_csv(rows, csv_path)
+        if key is not None and rows:
+            cache.put(key, rows, model)
 
         print(f"✅ Attendance exported to {csv_path}")
         return csv_path
@@ -159,6 +183,77 @@ def gemini_ocr_extract(
         return ""
 
 
+def gemini_ocr_extract_batch(
+    image_paths: List[str],
+    csv_paths: List[str],
+    api_key: Optional[str] = None,
+    model: str = DEFAULT_MODEL,
+    use_cache: bool = True,
+    max_bytes: int = BATCH_MAX_BYTES,
+    reports: Optional[List[dict]] = None,
+    backend: Optional[OCRBackend] = None
+) -> List[str]:
+    """
+    OCR several pages with one generateContent call and write one CSV per page.
+    Returns the CSV path of each page, or "" for a page that failed.
+
+    Cached pages are answered locally and the rest are sent together. If the
+    base64-encoded images exceed max_bytes, the request fails, a page is missing from
+    the answer, or the backend cannot batch at all, those pages are read one at
+    a time with gemini_ocr_extract. reports, if given, holds one dict per page
+    for its upload record.
+    """
+    backend = backend or get_backend()
+    results = [""] * len(image_paths)
+    reports = reports if reports is not None else [{} for _ in image_paths]
+    cache = get_cache()
+    cache_id = backend.cache_id(model)
+    keys = {}
+    todo = []
+    for i, image_path in enumerate(image_paths):
+        try:
+            if cache is not None:
+                keys[i] = ocr_fingerprint(image_path, cache_id, BATCH_PROMPT)
+                # A page read on its own or as part of a batch is equally good
+                rows = (cache.get(ocr_fingerprint(image_path, cache_id)) or cache.get(keys[i])) if use_cache else None
+                if rows:
+                    write_csv(rows, csv_paths[i])
+                    results[i] = csv_paths[i]
+                    continue
+        except Exception as e:
+            print(f"⚠️ OCR cache unavailable: {e}")
+        todo.append(i)
+
+    api_key = api_key or os.getenv("GEMINI_API_KEY")
+    retry = todo
+    if len(todo) > 1 and backend.supports_batch and (api_key or not backend.needs_api_key):
+        try:
+            texts = backend.read_pages([image_paths[i] for i in todo], model, api_key, [reports[i] for i in todo], max_bytes)
+        except Exception as e:
+            print(f"⚠️ Batch of {len(todo)} pages failed ({e}); reading them one at a time")
+            texts = [None] * len(todo)
+        retry = []
+        for i, text in zip(todo, texts):
+            rows = parse_tsv(text) if text else []
+            if not rows:
+                retry.append(i)
+                continue
+            write_csv(rows, csv_paths[i])
+            if i in keys:
+                cache.put(keys[i], rows, model)
+            results[i] = csv_paths[i]
+        if len(retry) < len(todo):
+            print(f"✅ Batch of {len(todo)} pages exported ({len(todo) - len(retry)} read, {len(retry)} to retry)")
+
+    for i in retry:
+        # The cache was consulted above; go straight to the backend
+        results[i] = gemini_ocr_extract(
+            image_paths[i], api_key=api_key, csv_path=csv_paths[i], model=model, use_cache=False,
+            report=reports[i], backend=backend
+        )
+    return results
+
+
 if __name__ == "__main__":
     csv_file = gemini_ocr_extract(
         r"file path",
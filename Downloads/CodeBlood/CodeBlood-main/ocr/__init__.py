@@ -0,0 +1 @@
+"""Gemini OCR client modules for AudtiFlow"""
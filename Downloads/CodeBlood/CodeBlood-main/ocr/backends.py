@@ -0,0 +1,274 @@
+"""Interchangeable OCR backends: Gemini, a local mock of the Gemini API, and Tesseract"""
+import base64
+import math
+import re
+import subprocess
+import threading
+from abc import ABC, abstractmethod
+from typing import List, Optional
+
+from ocr.client import GeminiClient, GeminiError, get_client
+from ocr.encoding import encode_for_upload, record_upload
+from ocr.prompts import BATCH_PROMPT, SYSTEM_PROMPT, split_pages
+from ocr.ratelimit import RateLimiter, get_limiter
+
+
+class OCRError(Exception):
+    """A page (or batch of pages) the backend could not read; detail carries the raw error body, if any."""
+
+    def __init__(self, message: str, detail: str = ""):
+        super().__init__(message)
+        self.detail = detail
+
+
+class OCRBackend(ABC):
+    """
+    Reads page images into TSV text with the attendance columns of SYSTEM_PROMPT.
+    gemini_ocr_extract handles caching, parsing and CSV output around it, so a
+    backend only has to turn images into text.
+    """
+
+    name = "base"
+    needs_api_key = False  # Whether callers must supply GEMINI_API_KEY
+    supports_batch = False  # Whether read_pages can read several pages in one request
+
+    def cache_id(self, model: str) -> str:
+        """What the OCR result cache and checkpoints key this backend's results by, in place of the model name."""
+        return f"{self.name}:{model}"
+
+    @abstractmethod
+    def read_page(self, image_path: str, model: str, api_key: Optional[str] = None, report: Optional[dict] = None) -> str:
+        """TSV of one page; raises OCRError if the page could not be read."""
+
+    def read_pages(
+        self,
+        image_paths: List[str],
+        model: str,
+        api_key: Optional[str] = None,
+        reports: Optional[List[dict]] = None,
+        max_bytes: int = 0,
+    ) -> List[Optional[str]]:
+        """
+        TSV of each page (None where the answer left a page out). Backends without
+        supports_batch raise OCRError, and gemini_ocr_extract_batch falls back to
+        reading the pages one at a time.
+        """
+        raise OCRError(f"{self.name} backend cannot batch")
+
+    def stats(self) -> dict:
+        return {}
+
+
+def _encode_page(image_path: str) -> tuple:
+    from config import OCR_UPLOAD
+
+    return encode_for_upload(
+        image_path,
+        mode=OCR_UPLOAD.get("mode", "original"),
+        max_side=OCR_UPLOAD.get("max_side", 0),
+        fmt=OCR_UPLOAD.get("format", "png"),
+        quality=OCR_UPLOAD.get("quality", 90),
+    )
+
+
+def _image_part(encoded: tuple, report: Optional[dict] = None) -> dict:
+    """Inline part of an encoded page about to be sent; the upload is counted here."""
+    data, mime_type, info = encoded
+    record_upload(info)
+    if report is not None:
+        report.update(info)
+    base64_image = base64.b64encode(data).decode("utf-8")
+    return {"inline_data": {"mime_type": mime_type, "data": base64_image}}
+
+
+def _response_text(data: dict) -> str:
+    text_output = ""
+    for cand in data.get("candidates", []):
+        content = cand.get("content", {})
+        for part in content.get("parts", []):
+            if "text" in part:
+                text_output += part["text"]
+    return text_output
+
+
+class GeminiBackend(OCRBackend):
+    """The Gemini generateContent API, through the shared pooled client unless given its own."""
+
+    name = "gemini"
+    needs_api_key = True
+    supports_batch = True
+
+    def __init__(self, client: Optional[GeminiClient] = None):
+        self._client = client
+
+    @property
+    def client(self) -> GeminiClient:
+        return self._client or get_client()
+
+    def cache_id(self, model: str) -> str:
+        # Bare model name, as results were keyed before backends existed
+        return model
+
+    def _generate(self, model: str, parts: List[dict], api_key: Optional[str]) -> str:
+        payload = {"contents": [{"role": "user", "parts": parts}]}
+        try:
+            return _response_text(self.client.generate_content(model, payload, api_key or ""))
+        except GeminiError as e:
+            raise OCRError(str(e), e.body) from e
+
+    def read_page(self, image_path: str, model: str, api_key: Optional[str] = None, report: Optional[dict] = None) -> str:
+        return self._generate(model, [{"text": SYSTEM_PROMPT}, _image_part(_encode_page(image_path), report)], api_key)
+
+    def read_pages(
+        self,
+        image_paths: List[str],
+        model: str,
+        api_key: Optional[str] = None,
+        reports: Optional[List[dict]] = None,
+        max_bytes: int = 0,
+    ) -> List[Optional[str]]:
+        reports = reports if reports is not None else [{} for _ in image_paths]
+        encoded = [_encode_page(image_path) for image_path in image_paths]
+        # Size of the images once base64-encoded into the request
+        batch_bytes = sum(4 * math.ceil(len(data) / 3) for data, _, _ in encoded)
+        if max_bytes and batch_bytes > max_bytes:
+            raise OCRError(f"batch of {len(image_paths)} pages is {batch_bytes / 1048576:.1f} MB")
+        parts = [{"text": BATCH_PROMPT}]
+        for n, (page, report) in enumerate(zip(encoded, reports), start=1):
+            parts.append({"text": f"Page {n}:"})
+            parts.append(_image_part(page, report))
+        return split_pages(self._generate(model, parts, api_key), len(image_paths))
+
+    def stats(self) -> dict:
+        return dict(self.client.stats)
+
+
+class MockGeminiBackend(GeminiBackend):
+    """
+    GeminiBackend talking to an in-process ocr.mock_server.MockGeminiServer, so
+    the whole HTTP path (pooling, retries, batching) runs without the network.
+    Results are cached under "mock:<model>" and never mix with real ones.
+    """
+
+    name = "mock"
+    needs_api_key = False
+
+    def __init__(self, server=None, client: Optional[GeminiClient] = None, limiter: Optional[RateLimiter] = None, **server_options):
+        from ocr.mock_server import MockGeminiServer
+
+        self.server = server or MockGeminiServer(**server_options).start()
+        super().__init__(client or GeminiClient(base_url=self.server.base_url, limiter=limiter))
+
+    def cache_id(self, model: str) -> str:
+        return f"mock:{model}"
+
+    def _generate(self, model: str, parts: List[dict], api_key: Optional[str]) -> str:
+        return super()._generate(model, parts, api_key or "mock")
+
+    def stats(self) -> dict:
+        return dict(super().stats(), server=self.server.stats())
+
+
+# A student row: roll number first, then at least an ID or a name
+_ROW_START = re.compile(r"^\W*\d")
+
+
+class LocalOCRBackend(OCRBackend):
+    """
+    Tesseract run on this machine (the tesseract executable must be installed).
+    Its plain-text lines are split on whitespace into TSV; the column fixing in
+    gemini.parse_tsv then merges multi-word names. Much less accurate than
+    Gemini on handwriting, but free, offline and quick to load-test with.
+    """
+
+    name = "local"
+
+    def __init__(self, tesseract_cmd: str = "tesseract", lang: str = "eng", psm: int = 6, timeout_s: float = 120):
+        self.tesseract_cmd = tesseract_cmd
+        self.lang = lang
+        self.psm = psm
+        self.timeout_s = timeout_s
+        self._lock = threading.Lock()
+        self._stats = dict(pages=0, failures=0)
+
+    def cache_id(self, model: str) -> str:
+        return f"tesseract:{self.lang}:psm{self.psm}"
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self._stats[key] += 1
+
+    def read_page(self, image_path: str, model: str, api_key: Optional[str] = None, report: Optional[dict] = None) -> str:
+        self._count("pages")
+        try:
+            out = subprocess.run(
+                [self.tesseract_cmd, image_path, "stdout", "-l", self.lang, "--psm", str(self.psm)],
+                capture_output=True,
+                text=True,
+                check=True,
+                timeout=self.timeout_s,
+            ).stdout
+        except FileNotFoundError as e:
+            self._count("failures")
+            raise OCRError(f"{self.tesseract_cmd} not found; install Tesseract or set OCR_LOCAL['tesseract_cmd']") from e
+        except subprocess.CalledProcessError as e:
+            self._count("failures")
+            raise OCRError(f"tesseract failed with exit code {e.returncode}", e.stderr or "") from e
+        except subprocess.TimeoutExpired as e:
+            self._count("failures")
+            raise OCRError(f"tesseract timed out after {self.timeout_s:.0f}s") from e
+        lines = ["\t".join(line.split()) for line in out.splitlines() if _ROW_START.match(line) and len(line.split()) >= 2]
+        return "\n".join(lines)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats)
+
+
+def create_backend(name: str) -> OCRBackend:
+    """A backend by its config name ("gemini", "mock" or "local"), configured from config.py."""
+    from config import OCR_LOCAL, OCR_MOCK
+    from ocr.mock_server import load_recordings
+
+    if name == "gemini":
+        return GeminiBackend()
+    if name == "mock":
+        recordings_dir = OCR_MOCK.get("recordings_dir")
+        return MockGeminiBackend(
+            recordings=load_recordings(str(recordings_dir)) if recordings_dir else None,
+            latency_s=OCR_MOCK.get("latency_s", 0.0),
+            latency_jitter_s=OCR_MOCK.get("latency_jitter_s", 0.0),
+            error_rate=OCR_MOCK.get("error_rate", 0.0),
+            error_statuses=OCR_MOCK.get("error_statuses", (429, 503)),
+            seed=OCR_MOCK.get("seed"),
+            limiter=get_limiter(),  # Shared like the real client's, so load tests see the same throttling
+        )
+    if name == "local":
+        return LocalOCRBackend(
+            tesseract_cmd=OCR_LOCAL.get("tesseract_cmd", "tesseract"),
+            lang=OCR_LOCAL.get("lang", "eng"),
+            psm=OCR_LOCAL.get("psm", 6),
+        )
+    raise ValueError(f"Unknown OCR backend {name!r}; expected gemini, mock or local")
+
+
+_backend: Optional[OCRBackend] = None
+_backend_lock = threading.Lock()
+
+
+def get_backend() -> OCRBackend:
+    """The process-wide backend named by config.OCR["backend"], built on first use."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            from config import OCR
+
+            _backend = create_backend(OCR.get("backend", "gemini"))
+        return _backend
+
+
+def set_backend(backend: Optional[OCRBackend]) -> None:
+    """Replace the process-wide backend (None rebuilds it from config on next use)."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
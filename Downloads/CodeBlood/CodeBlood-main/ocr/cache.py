@@ -0,0 +1,143 @@
+"""Persistent cache of parsed OCR results"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    rows TEXT NOT NULL,
+    bytes INTEGER NOT NULL,
+    created REAL NOT NULL,
+    used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_used ON results (used);
+"""
+
+
+class OCRResultCache:
+    """
+    SQLite store of parsed OCR rows keyed by ocr_fingerprint (image bytes,
+    model and prompt), so a page that has been read once is never sent to the
+    API again. A page that yielded no rows is not stored, so it is read again
+    next time. Entries older than ttl_s are dropped on lookup; once the stored
+    rows exceed max_bytes the least recently used entries are evicted.
+    """
+
+    def __init__(self, path: str, ttl_s: float = 0, max_bytes: int = 64 * 1024 * 1024):
+        self.path = str(path)
+        self.ttl_s = ttl_s
+        self.max_bytes = int(max_bytes)
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._total = self._conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM results").fetchone()[0]
+
+    def get(self, key: str) -> Optional[List[List[str]]]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT rows, bytes, created FROM results WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl_s and now - row[2] > self.ttl_s:
+                self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                self._total -= row[1]
+                self.expired += 1
+                row = None
+            rows = json.loads(row[0]) if row is not None else None
+            if not rows:
+                # Empty results stored before put() refused them read as misses too
+                if row is not None:
+                    self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                    self._total -= row[1]
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE results SET used = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return rows
+
+    def put(self, key: str, rows: List[List[str]], model: str = "") -> None:
+        if not rows:
+            return
+        data = json.dumps(rows, ensure_ascii=False)
+        size = len(data.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute("SELECT bytes FROM results WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, model, rows, bytes, created, used) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, data, size, now, now),
+            )
+            self._total += size - (old[0] if old else 0)
+            self._evict(key)
+
+    def _evict(self, keep: str) -> None:
+        # The entry just written stays even if it alone is over the limit
+        while self._total > self.max_bytes:
+            victim = self._conn.execute(
+                "SELECT key, bytes FROM results WHERE key != ? ORDER BY used LIMIT 1", (keep,)
+            ).fetchone()
+            if victim is None:
+                break
+            self._conn.execute("DELETE FROM results WHERE key = ?", (victim[0],))
+            self._total -= victim[1]
+            self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM results")
+            self._total = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            lookups = self.hits + self.misses
+            return dict(
+                hits=self.hits,
+                misses=self.misses,
+                hit_rate=round(self.hits / lookups, 3) if lookups else 0.0,
+                expired=self.expired,
+                evictions=self.evictions,
+                entries=entries,
+                bytes=self._total,
+                max_bytes=self.max_bytes,
+                ttl_s=self.ttl_s,
+            )
+
+
+_cache: Optional[OCRResultCache] = None
+_cache_loaded = False
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> Optional[OCRResultCache]:
+    """The process-wide cache built from config.OCR_CACHE, or None when it is disabled."""
+    global _cache, _cache_loaded
+    with _cache_lock:
+        if not _cache_loaded:
+            from config import OCR_CACHE
+
+            if OCR_CACHE.get("enabled"):
+                _cache = OCRResultCache(
+                    OCR_CACHE["path"],
+                    ttl_s=OCR_CACHE.get("ttl_days", 0) * 86400,
+                    max_bytes=OCR_CACHE.get("max_bytes", 64 * 1024 * 1024),
+                )
+            _cache_loaded = True
+        return _cache
+
+
+def set_cache(cache: Optional[OCRResultCache]) -> None:
+    """Replace the process-wide cache (None disables it)."""
+    global _cache, _cache_loaded
+    with _cache_lock:
+        _cache = cache
+        _cache_loaded = True
@@ -0,0 +1,215 @@
+"""Shared HTTP client for the Gemini generateContent API"""
+import email.utils
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from contextlib import nullcontext
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from ocr.ratelimit import RateLimiter, get_limiter
+
+DEFAULT_BASE_URL = "https://generativelanguage.googleapis.com"
+
+# Responses worth another attempt: rate limiting and transient server failures
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+# Responses that mean "slow down": they shrink the limiter's concurrency
+THROTTLE_STATUSES = {429, 503}
+
+
+class GeminiError(Exception):
+    """A generateContent call that failed for good (after any retries)."""
+
+    def __init__(self, message: str, status: Optional[int] = None, body: str = ""):
+        super().__init__(message)
+        self.status = status
+        self.body = body
+
+
+def request_key(payload: dict) -> str:
+    """Identity of a generateContent request for recording and replay: its text parts and images, in order."""
+    h = hashlib.sha256()
+    for content in payload.get("contents", []):
+        for part in content.get("parts", []):
+            if "text" in part:
+                h.update(b"t\0" + part["text"].encode("utf-8") + b"\0")
+            elif "inline_data" in part:
+                h.update(b"i\0" + part["inline_data"].get("data", "").encode("ascii") + b"\0")
+    return h.hexdigest()
+
+
+def parse_retry_after(value: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date); None if absent or unparseable."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when is None:
+        return None
+    return max(0.0, when.timestamp() - (now or time.time()))
+
+
+class GeminiClient:
+    """
+    One requests.Session shared by every OCR call, so pages reuse pooled
+    keep-alive connections instead of paying a TLS handshake each. Connection
+    errors, timeouts and RETRY_STATUSES are retried up to max_retries times with
+    full-jitter exponential backoff; a Retry-After header from the server takes
+    precedence over the computed delay (capped at max_retry_after).
+
+    Every attempt (retries included) first takes a slot from limiter, if any,
+    and reports back whether it succeeded (2xx) or was throttled (429/503).
+
+    With record_dir set, every successful response is also saved there as
+    <request key>.json for ocr.mock_server to replay.
+    """
+
+    def __init__(
+        self,
+        base_url: str = DEFAULT_BASE_URL,
+        connect_timeout: float = 10.0,
+        read_timeout: float = 60.0,
+        max_retries: int = 4,
+        backoff_base: float = 1.0,
+        backoff_max: float = 30.0,
+        max_retry_after: float = 120.0,
+        pool_size: int = 10,
+        record_dir: Optional[str] = None,
+        limiter: Optional[RateLimiter] = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max(0, int(max_retries))
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_retry_after = max_retry_after
+        self.record_dir = str(record_dir) if record_dir else None
+        self.limiter = limiter
+        self.session = requests.Session()
+        # Retries are handled below so that Retry-After and POST bodies are treated the same everywhere
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, pool_size), max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.stats = dict(requests=0, retries=0, failures=0, wait_s=0.0)
+        self._lock = threading.Lock()
+
+    def url(self, model: str) -> str:
+        return f"{self.base_url}/v1beta/models/{model}:generateContent"
+
+    def backoff(self, attempt: int) -> float:
+        """Full jitter: uniform in [0, min(backoff_max, backoff_base * 2**attempt)]."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _count(self, key: str, amount: float = 1) -> None:
+        with self._lock:
+            self.stats[key] += amount
+
+    def _wait(self, attempt: int, resp: Optional[requests.Response] = None) -> None:
+        delay = None
+        if resp is not None:
+            delay = parse_retry_after(resp.headers.get("Retry-After"))
+            if delay is not None:
+                delay = min(delay, self.max_retry_after)
+        if delay is None:
+            delay = self.backoff(attempt)
+        self._count("retries")
+        self._count("wait_s", delay)
+        time.sleep(delay)
+
+    def generate_content(self, model: str, payload: dict, api_key: str) -> dict:
+        """POST payload to model's generateContent and return the decoded JSON response."""
+        headers = {"Content-Type": "application/json", "x-goog-api-key": api_key}
+        url = self.url(model)
+        body = json.dumps(payload).encode("utf-8")
+        for attempt in range(self.max_retries + 1):
+            last = attempt == self.max_retries
+            try:
+                with self.limiter.slot(len(body)) if self.limiter else nullcontext(dict()) as outcome:
+                    self._count("requests")
+                    resp = self.session.post(url, headers=headers, data=body, timeout=self.timeout)
+                    outcome["throttled"] = resp.status_code in THROTTLE_STATUSES
+                    outcome["ok"] = 200 <= resp.status_code < 300
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if last:
+                    self._count("failures")
+                    raise GeminiError(f"Gemini request failed after {attempt + 1} attempts: {e}") from e
+                self._wait(attempt)
+                continue
+
+            if resp.status_code == 200:
+                try:
+                    data = resp.json()
+                except ValueError as e:
+                    self._count("failures")
+                    raise GeminiError("Gemini returned a response that is not JSON", 200, resp.text) from e
+                if self.record_dir:
+                    self._record(model, payload, data)
+                return data
+            if resp.status_code in RETRY_STATUSES and not last:
+                self._wait(attempt, resp)
+                continue
+            self._count("failures")
+            raise GeminiError(f"Gemini API error {resp.status_code}", resp.status_code, resp.text)
+        raise AssertionError("unreachable")
+
+    def _record(self, model: str, payload: dict, data: dict) -> None:
+        key = request_key(payload)
+        os.makedirs(self.record_dir, exist_ok=True)
+        path = os.path.join(self.record_dir, key + ".json")
+        try:
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(dict(key=key, model=model, recorded=time.time(), response=data), f, ensure_ascii=False)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            print(f"⚠️ Could not record Gemini response: {e}")
+
+    def close(self) -> None:
+        self.session.close()
+
+
+_client: Optional[GeminiClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> GeminiClient:
+    """The process-wide client, built from config.OCR on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            from config import OCR
+
+            _client = GeminiClient(
+                base_url=OCR.get("base_url") or DEFAULT_BASE_URL,
+                connect_timeout=OCR.get("connect_timeout_s", 10.0),
+                read_timeout=OCR.get("read_timeout_s", 60.0),
+                max_retries=OCR.get("max_retries", 4),
+                backoff_base=OCR.get("backoff_base_s", 1.0),
+                backoff_max=OCR.get("backoff_max_s", 30.0),
+                max_retry_after=OCR.get("max_retry_after_s", 120.0),
+                pool_size=OCR.get("pool_size", 10),
+                record_dir=OCR.get("record_dir"),
+                limiter=get_limiter(),
+            )
+        return _client
+
+
+def set_client(client: Optional[GeminiClient]) -> None:
+    """Replace the process-wide client (None rebuilds it from config on next use)."""
+    global _client
+    with _client_lock:
+        if _client is not None and _client is not client:
+            _client.close()
+        _client = client
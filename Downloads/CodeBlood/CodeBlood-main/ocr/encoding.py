@@ -0,0 +1,130 @@
+"""Re-encoding of page images before they are sent for OCR"""
+import os
+import threading
+from typing import Tuple
+
+import cv2
+import numpy as np
+
+# format -> (extension passed to cv2.imencode, mime_type sent with the image)
+FORMATS = {
+    "png": (".png", "image/png"),
+    "jpeg": (".jpg", "image/jpeg"),
+    "webp": (".webp", "image/webp"),
+}
+
+# original: the file on disk as is; color/gray: re-encoded in that colour space; bilevel: Otsu-thresholded black and white
+MODES = ("original", "color", "gray", "bilevel")
+
+_EXTENSION_MIME = {".png": "image/png", ".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".webp": "image/webp"}
+
+
+def mime_type_for(path: str) -> str:
+    return _EXTENSION_MIME.get(os.path.splitext(path)[1].lower(), "image/jpeg")
+
+
+def _encode_params(fmt: str, quality: int, bilevel: bool) -> list:
+    if fmt == "jpeg":
+        return [cv2.IMWRITE_JPEG_QUALITY, int(quality)]
+    if fmt == "webp":
+        return [cv2.IMWRITE_WEBP_QUALITY, int(quality)]
+    params = [cv2.IMWRITE_PNG_COMPRESSION, 9]
+    if bilevel and hasattr(cv2, "IMWRITE_PNG_BILEVEL"):
+        params += [cv2.IMWRITE_PNG_BILEVEL, 1]  # 1 bit per pixel
+    return params
+
+
+def encode_for_upload(
+    image_path: str,
+    mode: str = "gray",
+    max_side: int = 0,
+    fmt: str = "png",
+    quality: int = 90,
+) -> Tuple[bytes, str, dict]:
+    """
+    Bytes of image_path as they should be uploaded, their mime_type, and a record
+    of the conversion (bytes_before, bytes_after, size, mode, format).
+
+    The image is decoded in colour or grayscale, optionally binarized, scaled
+    down so its longer side is at most max_side (0 = no limit) and encoded as
+    fmt; quality applies to JPEG and WebP. If the result is not smaller than the
+    file on disk and was not scaled, the file is sent unchanged.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown upload mode {mode!r}; expected one of {', '.join(MODES)}")
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown upload format {fmt!r}; expected one of {', '.join(FORMATS)}")
+    with open(image_path, "rb") as f:
+        raw = f.read()
+    original = (raw, mime_type_for(image_path), dict(bytes_before=len(raw), bytes_after=len(raw), mode="original", format=None))
+    if mode == "original":
+        return original
+
+    flag = cv2.IMREAD_COLOR if mode == "color" else cv2.IMREAD_GRAYSCALE
+    img = cv2.imdecode(np.frombuffer(raw, np.uint8), flag)
+    if img is None:
+        raise ValueError(f"Could not decode image {image_path}")
+    h, w = img.shape[:2]
+    scaled = bool(max_side) and max(h, w) > max_side
+    if scaled:
+        scale = max_side / max(h, w)
+        img = cv2.resize(img, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+    if mode == "bilevel":
+        _, img = cv2.threshold(img, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+
+    ext, mime_type = FORMATS[fmt]
+    ok, buf = cv2.imencode(ext, img, _encode_params(fmt, quality, mode == "bilevel"))
+    if not ok:
+        raise ValueError(f"Could not encode {image_path} as {fmt}")
+    data = buf.tobytes()
+    if len(data) >= len(raw) and not scaled:
+        return original
+    info = dict(
+        bytes_before=len(raw),
+        bytes_after=len(data),
+        mode=mode,
+        format=fmt,
+        width=img.shape[1],
+        height=img.shape[0],
+    )
+    return data, mime_type, info
+
+
+class _UploadTotals:
+    """Running totals of the pages uploaded for OCR in this process, before and after encode_for_upload."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.pages = 0
+        self.reencoded = 0
+        self.bytes_before = 0
+        self.bytes_after = 0
+
+    def add(self, info: dict) -> None:
+        with self._lock:
+            self.pages += 1
+            self.reencoded += info["format"] is not None
+            self.bytes_before += info["bytes_before"]
+            self.bytes_after += info["bytes_after"]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(
+                pages=self.pages,
+                reencoded=self.reencoded,
+                bytes_before=self.bytes_before,
+                bytes_after=self.bytes_after,
+                ratio=round(self.bytes_after / self.bytes_before, 3) if self.bytes_before else None,
+            )
+
+
+_totals = _UploadTotals()
+
+
+def record_upload(info: dict) -> None:
+    """Count a page whose encode_for_upload result was sent in a request."""
+    _totals.add(info)
+
+
+def upload_stats() -> dict:
+    return _totals.stats()
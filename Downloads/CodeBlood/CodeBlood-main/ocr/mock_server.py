@@ -0,0 +1,238 @@
+"""
+Local stand-in for the Gemini generateContent endpoint, for exercising the
+OCR path (client pooling, retries, rate limits, batching) and load-testing it
+without network access.
+
+    python -m ocr.mock_server --port 8765 --recordings data/ocr_recordings --latency 1.5 --error-rate 0.05
+    GEMINI_BASE_URL=http://127.0.0.1:8765 python server.py
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from ocr.client import request_key
+
+# Rows returned by default: two students, tab separated like the real model output
+DEFAULT_TSV = "1\tS001\tAsha Rao\tP\tP\tA\tP\tP\tP\tP\tP\tP\tP\n2\tS002\tRavi Kumar\tP\tA\tP\tP\tP\tP\tP\tP\tP\tP"
+
+
+def gemini_response(text: str) -> dict:
+    """A generateContent response body whose single candidate answers with text."""
+    return {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}]}
+
+
+def parse_script(spec: str) -> List[Tuple[int, Optional[str]]]:
+    """'429:2,503,200' -> [(429, '2'), (503, None), (200, None)]; the part after ':' is sent as Retry-After."""
+    steps = []
+    for item in filter(None, (s.strip() for s in spec.split(","))):
+        status, _, retry_after = item.partition(":")
+        steps.append((int(status), retry_after or None))
+    return steps
+
+
+def load_recordings(directory: str) -> Dict[str, dict]:
+    """request key -> response body of every recording GeminiClient(record_dir=...) wrote to directory."""
+    recordings = {}
+    for path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+            recordings[entry["key"]] = entry["response"]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️ Skipping recording {path}: {e}")
+    return recordings
+
+
+class MockGeminiServer:
+    """
+    Answers POST /v1beta/models/<model>:generateContent.
+
+    Each request first takes the next (status, retry_after) step of script.
+    After that, a fraction error_rate of requests fail with one of
+    error_statuses (a 429 carries Retry-After: retry_after). The rest get a 200
+    with one of these bodies:
+
+    - the recording whose request key matches the prompt and images sent;
+    - otherwise the text of the recordings in turn, or text if there are none,
+      one per image under '=== PAGE n ===' lines when the request carries
+      several images.
+
+    Every response is held back for latency_s plus up to latency_jitter_s.
+    Requests, distinct client connections and the statuses served are counted,
+    so load tests and keep-alive reuse can be checked.
+    """
+
+    def __init__(
+        self,
+        script: Sequence[Tuple[int, Optional[str]]] = (),
+        text: str = DEFAULT_TSV,
+        recordings: Optional[Dict[str, dict]] = None,
+        latency_s: float = 0.0,
+        latency_jitter_s: float = 0.0,
+        error_rate: float = 0.0,
+        error_statuses: Sequence[int] = (429, 503),
+        retry_after: Optional[str] = "1",
+        seed: Optional[int] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.script = list(script)
+        self.text = text
+        self.recordings = dict(recordings or {})
+        self.latency_s = latency_s
+        self.latency_jitter_s = latency_jitter_s
+        self.error_rate = error_rate
+        self.error_statuses = list(error_statuses) or [503]
+        self.retry_after = retry_after
+        self.requests: List[dict] = []
+        self.connections = set()
+        self.statuses: Dict[int, int] = {}
+        self._random = random.Random(seed)
+        self._replay = list(self.recordings.values())
+        self._replay_next = 0
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def answer(self, payload: dict) -> dict:
+        recorded = self.recordings.get(request_key(payload))
+        if recorded is not None:
+            return recorded
+        parts = payload.get("contents", [{}])[0].get("parts", [])
+        images = sum(1 for p in parts if "inline_data" in p)
+        texts = [self._page_text() for _ in range(max(1, images))]
+        if images <= 1:
+            return gemini_response(texts[0])
+        return gemini_response("\n".join(f"=== PAGE {n} ===\n{t}" for n, t in enumerate(texts, start=1)))
+
+    def _page_text(self) -> str:
+        # Unmatched requests get the recorded answers in turn (or the default text)
+        with self._lock:
+            if not self._replay:
+                return self.text
+            recorded = self._replay[self._replay_next % len(self._replay)]
+            self._replay_next += 1
+        return "".join(
+            part.get("text", "")
+            for cand in recorded.get("candidates", [])
+            for part in cand.get("content", {}).get("parts", [])
+        )
+
+    def _next_step(self) -> Tuple[int, Optional[str]]:
+        with self._lock:
+            if self.script:
+                return self.script.pop(0)
+            if self.error_rate and self._random.random() < self.error_rate:
+                status = self._random.choice(self.error_statuses)
+                return status, self.retry_after if status == 429 else None
+            return 200, None
+
+    def _delay(self) -> float:
+        with self._lock:
+            return self.latency_s + (self._random.uniform(0, self.latency_jitter_s) if self.latency_jitter_s else 0.0)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(
+                requests=len(self.requests),
+                connections=len(self.connections),
+                statuses={str(k): v for k, v in sorted(self.statuses.items())},
+                bytes=sum(r["bytes"] for r in self.requests),
+            )
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                with mock._lock:
+                    mock.connections.add(self.client_address)
+                    mock.requests.append(dict(path=self.path, time=time.time(), bytes=len(body), api_key=self.headers.get("x-goog-api-key")))
+                if not self.path.endswith(":generateContent"):
+                    return self._send(404, {"error": {"code": 404, "message": "Not found"}})
+                try:
+                    payload = json.loads(body)
+                except ValueError:
+                    return self._send(400, {"error": {"code": 400, "message": "Invalid JSON payload"}})
+                status, retry_after = mock._next_step()
+                delay = mock._delay()
+                if delay:
+                    time.sleep(delay)
+                if status == 200:
+                    return self._send(200, mock.answer(payload))
+                self._send(status, {"error": {"code": status, "message": "mock failure"}}, retry_after)
+
+            def _send(self, status: int, payload: dict, retry_after: Optional[str] = None):
+                with mock._lock:
+                    mock.statuses[status] = mock.statuses.get(status, 0) + 1
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                if retry_after is not None:
+                    self.send_header("Retry-After", retry_after)
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+    def start(self) -> "MockGeminiServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="gemini-mock", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "MockGeminiServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a mock Gemini generateContent endpoint")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--script", default="", help="Statuses for the first requests, e.g. 429:1,503,200")
+    parser.add_argument("--recordings", default=None, help="Directory of responses recorded with OCR['record_dir']")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to hold each response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random latency, up to this many seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with an error")
+    parser.add_argument("--error-statuses", default="429,503", help="Statuses used for those errors")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    server = MockGeminiServer(
+        parse_script(args.script),
+        recordings=load_recordings(args.recordings) if args.recordings else None,
+        latency_s=args.latency,
+        latency_jitter_s=args.jitter,
+        error_rate=args.error_rate,
+        error_statuses=[int(s) for s in args.error_statuses.split(",") if s.strip()],
+        seed=args.seed,
+        port=args.port,
+    )
+    print(f"Mock Gemini API on {server.base_url} ({len(server.recordings)} recordings)")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
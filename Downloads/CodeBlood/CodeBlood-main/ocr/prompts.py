@@ -0,0 +1,37 @@
+"""Prompts sent with page images and parsing of the page-delimited answers"""
+import re
+from typing import List, Optional
+
+SYSTEM_PROMPT = (
+    "Extract the attendance table as TSV with columns exactly: "
+    "Roll\tStudentID\tName\tAtt1\tAtt2\tAtt3\tAtt4\tAtt5\tAtt6\tAtt7\tAtt8\tAtt9\tAtt10. "
+    "Return only raw TSV content without code fences or explanations ."
+)
+
+
+# Several pages in one request: the same instructions, plus a delimiter line per page
+BATCH_PROMPT = (
+    SYSTEM_PROMPT
+    + " The images are separate pages, each preceded by its page number. For every page, "
+    "output a line '=== PAGE <n> ===' with that number, followed by the TSV of that page only."
+)
+
+PAGE_MARKER = re.compile(r"^\s*=+\s*PAGE\s+(\d+)\s*=+\s*$", re.IGNORECASE | re.MULTILINE)
+
+
+def split_pages(text: str, count: int) -> List[Optional[str]]:
+    """
+    Cut a batch answer at its '=== PAGE n ===' lines into the TSV of pages
+    1..count. A page the model left out (or numbered twice) comes back as None.
+    """
+    pages: List[Optional[str]] = [None] * count
+    seen = set()
+    markers = list(PAGE_MARKER.finditer(text))
+    for i, m in enumerate(markers):
+        n = int(m.group(1))
+        end = markers[i + 1].start() if i + 1 < len(markers) else len(text)
+        if not 1 <= n <= count:
+            continue
+        pages[n - 1] = None if n in seen else text[m.end():end]
+        seen.add(n)
+    return pages
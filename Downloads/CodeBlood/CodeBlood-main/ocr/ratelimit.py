@@ -0,0 +1,200 @@
+"""Client-side rate limiting and adaptive concurrency for OCR API calls"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+
+class TokenBucket:
+    """
+    rate tokens per second, up to capacity banked. reserve() takes tokens at
+    once, going into debt if needed, and returns how long the caller must wait
+    for that debt to be repaid, so callers are served in arrival order without
+    a waiting loop.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float = 1) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # A single request larger than the bucket would never fit; it waits for a full bucket instead
+            self._tokens -= min(amount, self.capacity)
+            return max(0.0, -self._tokens / self.rate)
+
+    @property
+    def available(self) -> float:
+        with self._lock:
+            return min(self.capacity, self._tokens + (time.monotonic() - self._updated) * self.rate)
+
+
+class AIMDController:
+    """
+    Concurrency limit that grows additively on success (about +increase per
+    limit's worth of successful calls) and shrinks multiplicatively on a
+    throttling response. Calls that started before the last decrease do not
+    decrease it again, so one burst of 429s halves the limit only once. Other
+    failures (connection errors, other 5xx) leave the limit where it is.
+    """
+
+    def __init__(self, initial: float = 4, minimum: float = 1, maximum: float = 16, increase: float = 1.0, decrease: float = 0.5):
+        self.minimum = max(1.0, float(minimum))
+        self.maximum = max(self.minimum, float(maximum))
+        self.limit = min(self.maximum, max(self.minimum, float(initial)))
+        self.increase = increase
+        self.decrease = decrease
+        self.in_flight = 0
+        self.waiting = 0
+        self.decreases = 0
+        self._epoch = 0
+        self._cond = threading.Condition()
+
+    def acquire(self) -> int:
+        """Wait for a free slot; returns the epoch to hand back to release()."""
+        with self._cond:
+            self.waiting += 1
+            try:
+                while self.in_flight >= int(self.limit):
+                    self._cond.wait()
+            finally:
+                self.waiting -= 1
+            self.in_flight += 1
+            return self._epoch
+
+    def release(self, epoch: int, throttled: bool = False, success: bool = False) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                if epoch == self._epoch:
+                    self.limit = max(self.minimum, self.limit * self.decrease)
+                    self._epoch += 1
+                    self.decreases += 1
+            elif success:
+                self.limit = min(self.maximum, self.limit + self.increase / self.limit)
+            self._cond.notify_all()
+
+
+class RateLimiter:
+    """
+    Gate in front of every API request: an AIMD concurrency slot, then one
+    token from the requests-per-minute bucket and the payload's size from the
+    bytes-per-minute bucket (either limit 0 = off). One instance is shared by
+    every OCR caller in the process (see get_limiter), so concurrent runs,
+    /upload and OCRProcessor draw on the same quota.
+    """
+
+    def __init__(self, requests_per_min: float = 0, bytes_per_min: float = 0, burst_s: float = 10.0, concurrency: Optional[AIMDController] = None):
+        # Buckets hold burst_s seconds' worth of tokens, so an idle client can start with a short burst
+        self.requests = TokenBucket(requests_per_min / 60.0, max(1.0, requests_per_min / 60.0 * burst_s)) if requests_per_min else None
+        self.bytes = TokenBucket(bytes_per_min / 60.0, max(1.0, bytes_per_min / 60.0 * burst_s)) if bytes_per_min else None
+        self.concurrency = concurrency
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._metrics = dict(requests=0, throttled_requests=0, throttle_s=0.0, rate_limited_s=0.0, server_throttles=0)
+
+    @contextmanager
+    def slot(self, nbytes: int = 0) -> Iterator[dict]:
+        """
+        Hold a slot for one request of nbytes. On the yielded dict, set
+        outcome["ok"] = True for a 2xx answer, so the concurrency limit grows,
+        or outcome["throttled"] = True for a 429/503, so it backs off. A slot
+        left with neither (an exception, another error status) changes nothing.
+        """
+        start = time.monotonic()
+        with self._lock:
+            self._queued += 1
+        epoch = None
+        delay = 0.0
+        try:
+            if self.concurrency is not None:
+                epoch = self.concurrency.acquire()
+            delay = max(
+                self.requests.reserve(1) if self.requests else 0.0,
+                self.bytes.reserve(nbytes) if self.bytes else 0.0,
+            )
+            if delay:
+                time.sleep(delay)
+        except BaseException:
+            if epoch is not None:
+                self.concurrency.release(epoch)
+            raise
+        finally:
+            with self._lock:
+                self._queued -= 1
+        waited = time.monotonic() - start
+        with self._lock:
+            self._metrics["requests"] += 1
+            self._metrics["throttle_s"] += waited
+            self._metrics["rate_limited_s"] += delay
+            if waited > 0.001:
+                self._metrics["throttled_requests"] += 1
+
+        outcome = dict(ok=False, throttled=False, waited_s=waited)
+        try:
+            yield outcome
+        finally:
+            if outcome["throttled"]:
+                with self._lock:
+                    self._metrics["server_throttles"] += 1
+            if epoch is not None:
+                self.concurrency.release(epoch, outcome["throttled"], outcome["ok"])
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._metrics, queue_depth=self._queued)
+        stats["throttle_s"] = round(stats["throttle_s"], 3)
+        stats["rate_limited_s"] = round(stats["rate_limited_s"], 3)
+        if self.concurrency is not None:
+            stats.update(
+                concurrency_limit=round(self.concurrency.limit, 2),
+                in_flight=self.concurrency.in_flight,
+                concurrency_decreases=self.concurrency.decreases,
+            )
+        if self.requests is not None:
+            stats["request_tokens"] = round(self.requests.available, 2)
+        if self.bytes is not None:
+            stats["byte_tokens"] = int(self.bytes.available)
+        return stats
+
+
+_limiter: Optional[RateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter() -> RateLimiter:
+    """The process-wide limiter, built from config.OCR_LIMITS on first use."""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            from config import OCR_LIMITS
+
+            aimd = None
+            if OCR_LIMITS.get("adaptive_concurrency", True):
+                aimd = AIMDController(
+                    initial=OCR_LIMITS.get("concurrency_initial", 4),
+                    minimum=OCR_LIMITS.get("concurrency_min", 1),
+                    maximum=OCR_LIMITS.get("concurrency_max", 16),
+                    increase=OCR_LIMITS.get("concurrency_increase", 1.0),
+                    decrease=OCR_LIMITS.get("concurrency_decrease", 0.5),
+                )
+            _limiter = RateLimiter(
+                requests_per_min=OCR_LIMITS.get("requests_per_min", 0),
+                bytes_per_min=OCR_LIMITS.get("bytes_per_min", 0),
+                burst_s=OCR_LIMITS.get("burst_s", 10.0),
+                concurrency=aimd,
+            )
+        return _limiter
+
+
+def set_limiter(limiter: Optional[RateLimiter]) -> None:
+    """Replace the process-wide limiter (None rebuilds it from config on next use)."""
+    global _limiter
+    with _limiter_lock:
+        _limiter = limiter
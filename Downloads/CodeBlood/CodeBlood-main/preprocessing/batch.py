@@ -0,0 +1,136 @@
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from preprocessing.cache import PageCache
+from preprocessing.image_utils import preprocess_image
+
+
+PageResult = Tuple[int, Optional[np.ndarray], Optional[str], dict]
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def resolve_workers(workers: int) -> int:
+	"""0 means one worker per CPU core."""
+	if workers and workers > 0:
+		return int(workers)
+	return os.cpu_count() or 1
+
+
+def resolve_denoise_workers(denoise_workers: int, workers: int) -> int:
+	"""
+	Threads per page for tiled denoising. 0 shares the cores among the page
+	workers, so a full process pool gets one thread per page instead of
+	cores x cores threads.
+	"""
+	if denoise_workers and denoise_workers > 0:
+		return int(denoise_workers)
+	return max(1, (os.cpu_count() or 1) // resolve_workers(workers))
+
+
+def _init_worker() -> None:
+	# Each process handles one page; OpenCV's own thread pool would only oversubscribe the cores
+	cv2.setNumThreads(1)
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+	"""
+	The shared page pool. Workers are always spawned, never forked: forking the
+	threaded Flask/job process (with its OpenCV and SQLite state) can deadlock,
+	and spawn is what Windows and macOS do anyway. Spawned workers only need
+	this module; whatever the main script starts at import must stay behind a
+	multiprocessing.parent_process() check.
+	"""
+	global _pool, _pool_workers
+	with _pool_lock:
+		if _pool is None or _pool_workers != workers:
+			if _pool is not None:
+				_pool.shutdown(wait=False)
+			_pool = ProcessPoolExecutor(
+				max_workers=workers,
+				mp_context=multiprocessing.get_context("spawn"),
+				initializer=_init_worker,
+			)
+			_pool_workers = workers
+		return _pool
+
+
+def _preprocess_page(index: int, img_bgr: np.ndarray, settings: dict, profile: bool = False) -> PageResult:
+	info: dict = {}
+	start = time.perf_counter()
+	try:
+		cleaned = preprocess_image(img_bgr, profile=profile, info=info, **settings)
+	except Exception as e:
+		return index, None, str(e), info
+	info["ms"] = round((time.perf_counter() - start) * 1000, 1)
+	return index, cleaned, None, info
+
+
+def _collect(index: int, item) -> PageResult:
+	if isinstance(item, tuple):
+		return item
+	try:
+		return item.result()
+	except Exception as e:
+		# A crashed worker (e.g. BrokenProcessPool) only fails this page
+		return index, None, str(e), {}
+
+
+def iter_preprocessed(
+    pages: Iterable[np.ndarray],
+    workers: int = 0,
+    cache: Optional[PageCache] = None,
+    profile: bool = False,
+    **settings,
+) -> Iterator[PageResult]:
+	"""
+	Run preprocess_image over pages and yield (index, cleaned, error, info) in page
+	order, where info carries per-page details such as the detected skew.
+	With more than one worker the pages are fanned out to a shared process pool,
+	keeping at most two pages per worker in flight. Pages found in the cache are
+	returned without being recomputed. info["ms"] is the time spent preprocessing
+	the page; profile=True adds per-stage timings to info and skips cache lookups
+	(a hit has no stages to report), though the results are still cached.
+	"""
+	workers = resolve_workers(workers)
+	pool = _get_pool(workers) if workers > 1 else None
+
+	# Entries are (index, cache key, finished result tuple or pending Future)
+	pending = deque()
+
+	def ready() -> bool:
+		return bool(pending) and (isinstance(pending[0][2], tuple) or len(pending) >= workers * 2)
+
+	def pop() -> PageResult:
+		idx, key, item = pending.popleft()
+		result = _collect(idx, item)
+		info = result[3]
+		if key is not None and "cache" not in info:
+			info["cache"] = "miss"
+			if result[1] is not None:
+				cache.put(key, result[1])
+		return result
+
+	for idx, img in enumerate(pages):
+		key = cache.key(img, settings) if cache is not None else None
+		cached = cache.get(key) if key is not None and not profile else None
+		if cached is not None:
+			pending.append((idx, key, (idx, cached, None, {"cache": "hit"})))
+		elif pool is None:
+			pending.append((idx, key, _preprocess_page(idx, img, settings, profile)))
+		else:
+			pending.append((idx, key, pool.submit(_preprocess_page, idx, img, settings, profile)))
+		while ready():
+			yield pop()
+	while pending:
+		yield pop()
@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import cv2
+import numpy as np
+
+
+# Bump when preprocess_image changes its output so stale entries stop matching
+CACHE_VERSION = 1
+
+
+class PageCache:
+	"""
+	Persistent content-addressed store of cleaned pages. Entries are PNG files named
+	by sha256(input pixels + preprocessing settings) and evicted least recently used
+	once the directory grows past max_bytes.
+	"""
+
+	def __init__(self, directory: str, max_bytes: int = 512 * 1024 * 1024):
+		self.directory = str(directory)
+		self.max_bytes = int(max_bytes)
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self._lock = threading.Lock()
+		self._entries: "OrderedDict[str, int]" = OrderedDict()
+		self._total = 0
+		os.makedirs(self.directory, exist_ok=True)
+		self._load()
+
+	def _load(self) -> None:
+		files = []
+		for fname in os.listdir(self.directory):
+			if not fname.endswith(".png"):
+				continue
+			st = os.stat(os.path.join(self.directory, fname))
+			files.append((st.st_mtime, fname[:-4], st.st_size))
+		for _, key, size in sorted(files):
+			self._entries[key] = size
+			self._total += size
+
+	def _path(self, key: str) -> str:
+		return os.path.join(self.directory, key + ".png")
+
+	@staticmethod
+	def key(img: np.ndarray, settings: dict) -> str:
+		h = hashlib.sha256()
+		h.update(f"v{CACHE_VERSION}|{img.shape}|{img.dtype}|".encode())
+		h.update(json.dumps(settings, sort_keys=True, default=str).encode())
+		h.update(np.ascontiguousarray(img).data)
+		return h.hexdigest()
+
+	def get(self, key: str) -> Optional[np.ndarray]:
+		with self._lock:
+			known = key in self._entries
+			if known:
+				self._entries.move_to_end(key)
+		img = cv2.imread(self._path(key), cv2.IMREAD_UNCHANGED) if known else None
+		with self._lock:
+			if img is None:
+				self.misses += 1
+				if known:
+					# File vanished or is unreadable; forget it
+					self._total -= self._entries.pop(key, 0)
+				return None
+			self.hits += 1
+		try:
+			os.utime(self._path(key))
+		except OSError:
+			pass
+		return img
+
+	def put(self, key: str, img: np.ndarray) -> None:
+		ok, buf = cv2.imencode(".png", img)
+		if not ok:
+			return
+		data = buf.tobytes()
+		path = self._path(key)
+		tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+		with open(tmp, "wb") as f:
+			f.write(data)
+		os.replace(tmp, path)
+		with self._lock:
+			self._total -= self._entries.pop(key, 0)
+			self._entries[key] = len(data)
+			self._total += len(data)
+			self._evict()
+
+	def _evict(self) -> None:
+		while self._total > self.max_bytes and len(self._entries) > 1:
+			old_key, size = self._entries.popitem(last=False)
+			self._total -= size
+			self.evictions += 1
+			try:
+				os.remove(self._path(old_key))
+			except OSError:
+				pass
+
+	def stats(self) -> dict:
+		with self._lock:
+			lookups = self.hits + self.misses
+			return dict(
+				hits=self.hits,
+				misses=self.misses,
+				hit_rate=round(self.hits / lookups, 3) if lookups else 0.0,
+				evictions=self.evictions,
+				entries=len(self._entries),
+				bytes=self._total,
+				max_bytes=self.max_bytes,
+			)
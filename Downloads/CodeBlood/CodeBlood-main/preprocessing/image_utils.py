@@ -1,9 +1,14 @@
-from typing import Tuple
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import List, Optional, Sequence, Tuple
 
 import cv2
 import numpy as np
 from PIL import Image
 
+from preprocessing.profiling import StageProfiler
+
 
 def convert_pil_to_cv(img: Image.Image) -> np.ndarray:
 	return cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
@@ -13,59 +18,136 @@ def convert_cv_to_pil(img: np.ndarray) -> Image.Image:
 	return Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
 
 
-def deskew_image(gray: np.ndarray) -> np.ndarray:
-	coords = np.column_stack(np.where(gray > 0))
-	if coords.size == 0:
-		return gray
-	angle = cv2.minAreaRect(coords)[-1]
-	if angle < -45:
-		angle = -(90 + angle)
-	else:
-		angle = -angle
-	(h, w) = gray.shape[:2]
+def rotate_image(img: np.ndarray, angle: float) -> np.ndarray:
+	(h, w) = img.shape[:2]
 	center = (w // 2, h // 2)
 	M = cv2.getRotationMatrix2D(center, angle, 1.0)
-	rotated = cv2.warpAffine(gray, M, (w, h), flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
-	return rotated
+	return cv2.warpAffine(img, M, (w, h), flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
 
 
-def preprocess_image(
-    img_bgr: np.ndarray,
-    resize_width: int = 1500,
-    adaptive_block: int = 35,
-    adaptive_c: int = 5,
-    deskew: bool = True,
-    remove_shadow: bool = False,
-    clahe_clip: float = 0.0,
-    denoise_strength: int = 0,
+def _projection_score(ink: np.ndarray, angle: float) -> float:
+	(h, w) = ink.shape[:2]
+	M = cv2.getRotationMatrix2D((w // 2, h // 2), angle, 1.0)
+	rotated = cv2.warpAffine(ink, M, (w, h), flags=cv2.INTER_NEAREST, borderValue=0)
+	profile = rotated.sum(axis=1, dtype=np.float64)
+	# Text lines aligned with the rows give the sharpest profile
+	return float(np.sum(np.diff(profile) ** 2))
+
+
+def estimate_skew_angle(
+    gray: np.ndarray,
+    max_width: int = 800,
+    max_angle: float = 10.0,
+    coarse_step: float = 1.0,
+    fine_step: float = 0.1,
+) -> Tuple[float, float]:
+	"""
+	Estimate the rotation (degrees) that straightens the page, using horizontal
+	projection profiles on a downsampled copy. Returns (angle, confidence) where
+	confidence is 0 for a flat response (blank page) and approaches 1 for a sharp peak.
+	"""
+	h, w = gray.shape[:2]
+	if h == 0 or w == 0:
+		return 0.0, 0.0
+	scale = min(1.0, max_width / float(w))
+	small = cv2.resize(gray, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA) if scale < 1.0 else gray
+	_, ink = cv2.threshold(small, 0, 1, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+
+	coarse = np.arange(-max_angle, max_angle + coarse_step / 2, coarse_step)
+	scores = np.array([_projection_score(ink, a) for a in coarse])
+	best = float(coarse[int(np.argmax(scores))])
+	fine = np.arange(best - coarse_step, best + coarse_step + fine_step / 2, fine_step)
+	fine_scores = np.array([_projection_score(ink, a) for a in fine])
+	angle = float(fine[int(np.argmax(fine_scores))])
+
+	peak = float(fine_scores.max())
+	if peak <= 0:
+		return 0.0, 0.0
+	confidence = (peak - float(np.median(scores))) / peak
+	return round(angle, 2) + 0.0, round(max(0.0, min(1.0, confidence)), 3)
+
+
+def deskew_image(
+    gray: np.ndarray,
+    method: str = "minarea",
+    min_angle: float = 0.0,
+    info: Optional[dict] = None,
 ) -> np.ndarray:
+	"""
+	Rotate a thresholded page upright. "minarea" fits a rectangle around every
+	foreground pixel at full resolution; "projection" estimates the angle on a
+	downsampled copy. Rotations smaller than min_angle are skipped.
+	"""
+	confidence = None
+	if method == "projection":
+		angle, confidence = estimate_skew_angle(gray)
+	else:
+		coords = np.column_stack(np.where(gray > 0))
+		if coords.size == 0:
+			return gray
+		angle = cv2.minAreaRect(coords)[-1]
+		if angle < -45:
+			angle = -(90 + angle)
+		else:
+			angle = -angle
+	applied = abs(angle) >= min_angle and angle != 0
+	if info is not None:
+		info.update(deskew_angle=float(angle), deskew_confidence=confidence, deskew_applied=applied)
+	if not applied:
+		return gray
+	return rotate_image(gray, angle)
+
+
+def _resize(img_bgr: np.ndarray, resize_width: int) -> np.ndarray:
 	# Resize proportionally
 	h, w = img_bgr.shape[:2]
+	if w == resize_width:
+		# Already rendered at the target width (e.g. PDFs rasterized to size)
+		return img_bgr
 	scale = resize_width / max(1, w)
-	img = cv2.resize(img_bgr, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+	return cv2.resize(img_bgr, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+
+
+def _grayscale(img: np.ndarray) -> np.ndarray:
+	return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
 
-	# Grayscale
-	gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+def _estimate_background(gray: np.ndarray, kernel_size: int, scale: float) -> np.ndarray:
+	factor = int(round(1.0 / scale)) if scale > 0 else 1
+	if factor <= 1:
+		kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (kernel_size, kernel_size))
+		return cv2.morphologyEx(gray, cv2.MORPH_OPEN, kernel)
+	# Illumination varies slowly, so open a reduced copy and upsample the result.
+	# Min-pooling (erode, then sample) keeps the dark strokes the opening relies on.
+	h, w = gray.shape[:2]
+	pooled = cv2.erode(gray, cv2.getStructuringElement(cv2.MORPH_RECT, (factor, factor)))
+	small = pooled[factor // 2::factor, factor // 2::factor]
+	small_kernel = max(3, int(round(kernel_size / factor)) | 1)
+	kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (small_kernel, small_kernel))
+	background = cv2.morphologyEx(small, cv2.MORPH_OPEN, kernel)
+	return cv2.resize(background, (w, h), interpolation=cv2.INTER_LINEAR)
 
+
+def _remove_shadow(gray: np.ndarray, shadow_scale: float = 1.0) -> np.ndarray:
 	# Simple but effective shadow removal
-	if remove_shadow:
-		try:
-			# Use single kernel for reliable shadow removal
-			kernel_size = max(25, int(min(gray.shape[:2]) * 0.05))
-			if kernel_size % 2 == 0:
-				kernel_size += 1
-			kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (kernel_size, kernel_size))
-			background = cv2.morphologyEx(gray, cv2.MORPH_OPEN, kernel)
-			# Ensure minimum background value
-			background = np.maximum(background, 5)
-			# Apply illumination correction
-			normalized = cv2.divide(gray, background, scale=255)
-			normalized = np.clip(normalized, 0, 255)
-			# Conservative blending
-			gray = cv2.addWeighted(normalized, 0.7, gray, 0.3, 0).astype(np.uint8)
-		except:
-			pass
+	try:
+		# Use single kernel for reliable shadow removal
+		kernel_size = max(25, int(min(gray.shape[:2]) * 0.05))
+		if kernel_size % 2 == 0:
+			kernel_size += 1
+		background = _estimate_background(gray, kernel_size, shadow_scale)
+		# Ensure minimum background value
+		background = np.maximum(background, 5)
+		# Apply illumination correction
+		normalized = cv2.divide(gray, background, scale=255)
+		normalized = np.clip(normalized, 0, 255)
+		# Conservative blending
+		return cv2.addWeighted(normalized, 0.7, gray, 0.3, 0).astype(np.uint8)
+	except:
+		return gray
+
 
+def _apply_clahe(gray: np.ndarray, clahe_clip: float) -> np.ndarray:
 	# Moderate CLAHE for better contrast
 	if clahe_clip and clahe_clip > 0:
 		clip_value = float(clahe_clip)
@@ -73,38 +155,79 @@ def preprocess_image(
 		clip_value = 2.0  # Moderate enhancement
 	try:
 		clahe = cv2.createCLAHE(clipLimit=clip_value, tileGridSize=(8, 8))
-		gray = clahe.apply(gray)
+		return clahe.apply(gray)
 	except:
-		pass
+		return gray
+
+
+def denoise_tiled(
+    gray: np.ndarray,
+    h: int,
+    tile_size: int = 512,
+    workers: int = 0,
+    template_window: int = 7,
+    search_window: int = 21,
+) -> np.ndarray:
+	"""
+	fastNlMeansDenoising over tiles on a thread pool (OpenCV releases the GIL).
+	Each tile is cut with a margin of search_window // 2 + template_window // 2
+	pixels, so every kept pixel sees the same neighbourhood as in a single-shot
+	call and the stitched result has no seams. With a single thread the margins
+	are pure overhead, so the page is denoised in one call instead.
+	"""
+	height, width = gray.shape[:2]
+	margin = search_window // 2 + template_window // 2
+	workers = workers if workers and workers > 0 else (os.cpu_count() or 1)
+	if tile_size <= 0 or workers <= 1 or (height <= tile_size and width <= tile_size):
+		return cv2.fastNlMeansDenoising(gray, None, h=h, templateWindowSize=template_window, searchWindowSize=search_window)
+
+	out = np.empty_like(gray)
+	tiles = [(y, x) for y in range(0, height, tile_size) for x in range(0, width, tile_size)]
+
+	def run(origin: Tuple[int, int]) -> None:
+		y, x = origin
+		y2, x2 = min(y + tile_size, height), min(x + tile_size, width)
+		py, px = max(0, y - margin), max(0, x - margin)
+		py2, px2 = min(height, y2 + margin), min(width, x2 + margin)
+		tile = np.ascontiguousarray(gray[py:py2, px:px2])
+		den = cv2.fastNlMeansDenoising(tile, None, h=h, templateWindowSize=template_window, searchWindowSize=search_window)
+		out[y:y2, x:x2] = den[y - py:y2 - py, x - px:x2 - px]
+
+	with ThreadPoolExecutor(max_workers=min(workers, len(tiles))) as pool:
+		list(pool.map(run, tiles))
+	return out
+
 
+def _denoise(gray: np.ndarray, denoise_strength: int, denoise_tile: int = 0, denoise_workers: int = 0) -> np.ndarray:
 	# Professional denoising for document quality
 	if denoise_strength and denoise_strength > 0:
 		try:
-			blur = cv2.fastNlMeansDenoising(gray, None, h=int(denoise_strength), templateWindowSize=7, searchWindowSize=21)
+			if denoise_tile and denoise_tile > 0:
+				return denoise_tiled(gray, int(denoise_strength), tile_size=int(denoise_tile), workers=denoise_workers)
+			return cv2.fastNlMeansDenoising(gray, None, h=int(denoise_strength), templateWindowSize=7, searchWindowSize=21)
 		except:
 			# Use bilateral filter for better edge preservation
-			blur = cv2.bilateralFilter(gray, 5, 50, 50)
-	else:
-		# Use bilateral filter to preserve text edges
-		blur = cv2.bilateralFilter(gray, 5, 50, 50)
+			return cv2.bilateralFilter(gray, 5, 50, 50)
+	# Use bilateral filter to preserve text edges
+	return cv2.bilateralFilter(gray, 5, 50, 50)
+
 
+def _deskew(blur: np.ndarray, deskew_method: str, deskew_min_angle: float, deskew_info: dict) -> np.ndarray:
 	# Deskew on binary-friendly version
-	if deskew:
-		try:
-			# Use OTSU for angle estimation
-			_, th = cv2.threshold(blur, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-			rot = deskew_image(th)
-			work = rot
-		except:
-			work = blur
-	else:
-		work = blur
+	try:
+		# Use OTSU for angle estimation
+		_, th = cv2.threshold(blur, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+		return deskew_image(th, method=deskew_method, min_angle=deskew_min_angle, info=deskew_info)
+	except:
+		return blur
+
 
+def _threshold(work: np.ndarray, adaptive_block: int, adaptive_c: int) -> np.ndarray:
 	# Optimized adaptive threshold for crisp text
 	try:
 		# Use optimized block size for document quality
 		block_size = max(11, adaptive_block if adaptive_block % 2 == 1 else adaptive_block + 1)
-		binary = cv2.adaptiveThreshold(
+		return cv2.adaptiveThreshold(
 			work,
 			255,
 			cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
@@ -115,7 +238,10 @@ def preprocess_image(
 	except:
 		# Fallback to OTSU with proper parameters
 		_, binary = cv2.threshold(work, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+		return binary
 
+
+def _morphology(binary: np.ndarray) -> np.ndarray:
 	# Professional morphological cleaning for document quality
 	try:
 		# Step 1: Remove small noise
@@ -124,10 +250,12 @@ def preprocess_image(
 		
 		# Step 2: Close small gaps in characters
 		kernel_close = cv2.getStructuringElement(cv2.MORPH_RECT, (2, 2))
-		clean = cv2.morphologyEx(clean1, cv2.MORPH_CLOSE, kernel_close, iterations=1)
+		return cv2.morphologyEx(clean1, cv2.MORPH_CLOSE, kernel_close, iterations=1)
 	except:
-		clean = binary
-	
+		return binary
+
+
+def _sharpen(clean: np.ndarray) -> np.ndarray:
 	# Professional sharpening for crisp text
 	try:
 		# Use unsharp masking for professional results
@@ -138,13 +266,18 @@ def preprocess_image(
 		# Apply unsharp mask for professional sharpening
 		gaussian = cv2.GaussianBlur(sharpened, (0, 0), 1.5)
 		unsharp_mask = cv2.addWeighted(sharpened, 1.3, gaussian, -0.3, 0)
-		sharpened = np.clip(unsharp_mask, 0, 255).astype(np.uint8)
+		return np.clip(unsharp_mask, 0, 255).astype(np.uint8)
 	except:
-		sharpened = clean
+		return clean
+
 
+def _blend(img: np.ndarray, sharpened: np.ndarray, deskew_info: dict) -> np.ndarray:
 	# Return colored output - keep original colors with enhanced clarity
 	# Use the original resized image as base and apply processing as enhancement
 	enhanced_original = img.copy()
+	if deskew_info.get("deskew_applied"):
+		# Keep the colour base aligned with the rotated text layer
+		enhanced_original = rotate_image(enhanced_original, deskew_info["deskew_angle"])
 	
 	# Convert sharpened to 3-channel for blending
 	sharpened_3ch = cv2.cvtColor(sharpened, cv2.COLOR_GRAY2BGR)
@@ -153,8 +286,69 @@ def preprocess_image(
 	final_output = cv2.addWeighted(enhanced_original, 0.6, sharpened_3ch, 0.4, 0)
 	
 	# Ensure proper color range
-	final_output = np.clip(final_output, 0, 255).astype(np.uint8)
-	
+	return np.clip(final_output, 0, 255).astype(np.uint8)
+
+
+def _run_stage(profiler: Optional[StageProfiler], name: str, fn, *args):
+	if profiler is None:
+		return fn(*args)
+	with profiler.stage(name):
+		return fn(*args)
+
+
+def preprocess_image(
+    img_bgr: np.ndarray,
+    resize_width: int = 1500,
+    adaptive_block: int = 35,
+    adaptive_c: int = 5,
+    deskew: bool = True,
+    remove_shadow: bool = False,
+    clahe_clip: float = 0.0,
+    denoise_strength: int = 0,
+    deskew_method: str = "minarea",
+    deskew_min_angle: float = 0.0,
+    denoise_tile: int = 0,
+    denoise_workers: int = 0,
+    shadow_scale: float = 1.0,
+    crop_table: bool = False,
+    table_columns: Optional[Sequence[int]] = None,
+    table_header_rows: int = 0,
+    profile: bool = False,
+    info: Optional[dict] = None,
+) -> np.ndarray:
+	"""
+	Clean a BGR page for OCR. shadow_scale < 1 estimates the shadow background on
+	a copy reduced by that factor. denoise_tile > 0 runs the non-local means denoiser
+	tile by tile on denoise_workers threads. crop_table cuts the output down to the
+	ruled table body (see crop_table_columns). With profile=True the wall time and
+	peak allocation of every stage are recorded in info["stages"].
+	"""
+	profiler = StageProfiler() if profile else None
+	deskew_info: dict = {}
+	with profiler if profiler is not None else nullcontext():
+		img = _run_stage(profiler, "resize", _resize, img_bgr, resize_width)
+		gray = _run_stage(profiler, "grayscale", _grayscale, img)
+		if remove_shadow:
+			gray = _run_stage(profiler, "shadow", _remove_shadow, gray, shadow_scale)
+		gray = _run_stage(profiler, "clahe", _apply_clahe, gray, clahe_clip)
+		blur = _run_stage(profiler, "denoise", _denoise, gray, denoise_strength, denoise_tile, denoise_workers)
+		if deskew:
+			work = _run_stage(profiler, "deskew", _deskew, blur, deskew_method, deskew_min_angle, deskew_info)
+		else:
+			work = blur
+		binary = _run_stage(profiler, "threshold", _threshold, work, adaptive_block, adaptive_c)
+		clean = _run_stage(profiler, "morphology", _morphology, binary)
+		sharpened = _run_stage(profiler, "sharpen", _sharpen, clean)
+		final_output = _run_stage(profiler, "blend", _blend, img, sharpened, deskew_info)
+		if crop_table:
+			final_output, grid = _run_stage(profiler, "crop", _crop_table, final_output, crop_table, table_columns, table_header_rows)
+
+	if info is not None:
+		info.update(deskew_info)
+		if crop_table:
+			info["table_grid"] = dict(rows=grid["rows"], cols=grid["cols"]) if grid else None
+		if profiler is not None:
+			info["stages"] = profiler.stages
 	return final_output
 
 
@@ -187,3 +381,83 @@ def detect_and_crop_table_region(img_bgr: np.ndarray) -> np.ndarray:
 	return img_bgr[y1:y2, x1:x2]
 
 
+
+def _line_positions(profile: np.ndarray, min_length: float) -> List[int]:
+	"""Centres of runs of rows (or columns) whose line coverage reaches min_length."""
+	hits = np.flatnonzero(profile >= min_length)
+	if hits.size == 0:
+		return []
+	# Split where consecutive indices are not adjacent, i.e. one run per drawn line
+	runs = np.split(hits, np.flatnonzero(np.diff(hits) > 1) + 1)
+	return [int(run.mean()) for run in runs]
+
+
+def extract_table_grid(img_bgr: np.ndarray, min_line_ratio: float = 0.5) -> Optional[dict]:
+	"""
+	Locate the ruled attendance table. Returns row and column line positions
+	(pixels, top to bottom / left to right), the table bounding box and
+	cells[r][c] = (x, y, w, h) for the cell between rows r, r+1 and columns c, c+1.
+	A line counts when it spans at least min_line_ratio of the table's extent.
+	Returns None when fewer than two lines are found in either direction.
+	"""
+	gray = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY) if img_bgr.ndim == 3 else img_bgr
+	h, w = gray.shape[:2]
+	ink = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 15, 10)
+	# Keep only strokes much longer than any character
+	kernel_h = cv2.getStructuringElement(cv2.MORPH_RECT, (max(40, w // 30), 1))
+	kernel_v = cv2.getStructuringElement(cv2.MORPH_RECT, (1, max(40, h // 30)))
+	horizontal = cv2.morphologyEx(ink, cv2.MORPH_OPEN, kernel_h)
+	vertical = cv2.morphologyEx(ink, cv2.MORPH_OPEN, kernel_v)
+
+	row_cover = np.count_nonzero(horizontal, axis=1)
+	col_cover = np.count_nonzero(vertical, axis=0)
+	if row_cover.max(initial=0) == 0 or col_cover.max(initial=0) == 0:
+		return None
+	rows = _line_positions(row_cover, min_line_ratio * row_cover.max())
+	cols = _line_positions(col_cover, min_line_ratio * col_cover.max())
+	if len(rows) < 2 or len(cols) < 2:
+		return None
+
+	cells = [
+		[(cols[c], rows[r], cols[c + 1] - cols[c], rows[r + 1] - rows[r]) for c in range(len(cols) - 1)]
+		for r in range(len(rows) - 1)
+	]
+	return dict(
+		rows=rows,
+		cols=cols,
+		bbox=(cols[0], rows[0], cols[-1] - cols[0], rows[-1] - rows[0]),
+		cells=cells,
+	)
+
+
+def crop_table_columns(
+    img: np.ndarray,
+    grid: dict,
+    columns: Optional[Sequence[int]] = None,
+    header_rows: int = 0,
+    pad: int = 2,
+) -> np.ndarray:
+	"""
+	Cut the table body out of a page: drop header_rows grid rows and everything
+	outside the table, and keep only the given column indices (all when None),
+	placed side by side in their original order.
+	"""
+	rows, cols = grid["rows"], grid["cols"]
+	top = rows[min(max(0, header_rows), len(rows) - 2)]
+	bottom = rows[-1]
+	y1, y2 = max(0, top - pad), min(img.shape[0], bottom + pad)
+	wanted = range(len(cols) - 1) if columns is None else [c for c in columns if 0 <= c < len(cols) - 1]
+	strips = [img[y1:y2, max(0, cols[c] - pad):min(img.shape[1], cols[c + 1] + pad)] for c in sorted(wanted)]
+	if not strips:
+		return img[y1:y2, max(0, cols[0] - pad):min(img.shape[1], cols[-1] + pad)]
+	return np.hstack(strips)
+
+
+def _crop_table(img: np.ndarray, crop_table: bool, table_columns: Optional[Sequence[int]], table_header_rows: int):
+	if not crop_table:
+		return img, None
+	grid = extract_table_grid(img)
+	if grid is None:
+		# No ruled grid; fall back to the largest line-bounded region
+		return detect_and_crop_table_region(img), None
+	return crop_table_columns(img, grid, table_columns, table_header_rows), grid
@@ -0,0 +1,66 @@
+from typing import List, Optional, Sequence
+
+import cv2
+import numpy as np
+
+
+def perceptual_hash(gray: np.ndarray, hash_size: int = 16) -> int:
+	"""
+	DCT perceptual hash: the low-frequency hash_size x hash_size DCT block of a
+	4x reduced thumbnail, one bit per coefficient above the block median.
+	hash_size=16 (256 bits) keeps enough detail to tell apart two sheets printed
+	from the same template but filled in differently.
+	"""
+	side = hash_size * 4
+	thumb = cv2.resize(gray, (side, side), interpolation=cv2.INTER_AREA).astype(np.float32)
+	block = cv2.dct(thumb)[:hash_size, :hash_size].flatten()
+	bits = block > np.median(block[1:])
+	return int("".join("1" if b else "0" for b in bits), 2)
+
+
+def hamming(a: int, b: int) -> int:
+	return bin(a ^ b).count("1")
+
+
+def ink_density(gray: np.ndarray) -> float:
+	"""Fraction of pixels that are locally darker than the paper around them."""
+	ink = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 25, 15)
+	return float(np.count_nonzero(ink)) / max(1, ink.size)
+
+
+def classify_pages(
+    paths: Sequence[str],
+    blank_ink_density: float = 0.005,
+    duplicate_max_distance: int = 24,
+    thumb_width: int = 512,
+) -> List[dict]:
+	"""
+	Decide which pages need OCR. Returns one dict per path with its hash and ink
+	density and a status of "ocr", "blank" (ink below blank_ink_density) or
+	"duplicate" (hash within duplicate_max_distance bits of an earlier page, named
+	in duplicate_of).
+	"""
+	pages: List[dict] = []
+	kept: List[dict] = []
+	for path in paths:
+		gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+		if gray is None:
+			pages.append(dict(path=path, hash=None, ink=None, status="ocr", duplicate_of=None))
+			continue
+		if gray.shape[1] > thumb_width:
+			scale = thumb_width / gray.shape[1]
+			gray = cv2.resize(gray, (thumb_width, max(1, int(gray.shape[0] * scale))), interpolation=cv2.INTER_AREA)
+		page = dict(path=path, hash=perceptual_hash(gray), ink=round(ink_density(gray), 4), status="ocr", duplicate_of=None)
+		if page["ink"] < blank_ink_density:
+			page["status"] = "blank"
+		else:
+			match: Optional[dict] = next(
+				(k for k in kept if hamming(k["hash"], page["hash"]) <= duplicate_max_distance), None
+			)
+			if match is not None:
+				page["status"] = "duplicate"
+				page["duplicate_of"] = match["path"]
+			else:
+				kept.append(page)
+		pages.append(page)
+	return pages
@@ -1,6 +1,11 @@
-from typing import List, Optional
+from typing import Dict, Iterator, List, Optional, Set
 
+import glob
 import io
+import os
+import re
+import subprocess
+import tempfile
 from PIL import Image
 
 
@@ -9,10 +14,203 @@ def _get_poppler_path() -> Optional[str]:
 	return os.environ.get("POPPLER_PATH") or None
 
 
-def convert_pdf_to_images(pdf_bytes: bytes, dpi: int = 300) -> List[Image.Image]:
+def _render_size(target_width: Optional[int]):
+	# poppler scales each page to this width and keeps its aspect ratio
+	return (int(target_width), None) if target_width else None
+
+
+def convert_pdf_to_images(pdf_bytes: bytes, dpi: int = 300, target_width: Optional[int] = None) -> List[Image.Image]:
 	from pdf2image import convert_from_bytes
-	images = convert_from_bytes(pdf_bytes, dpi=dpi, poppler_path=_get_poppler_path())
+	images = convert_from_bytes(pdf_bytes, dpi=dpi, size=_render_size(target_width), poppler_path=_get_poppler_path())
 	# Ensure RGB mode
 	return [img.convert("RGB") for img in images]
 
 
+def _run_poppler(tool: str, args: List[str], poppler_path: Optional[str]) -> str:
+	exe = os.path.join(poppler_path, tool) if poppler_path else tool
+	return subprocess.run([exe, *args], capture_output=True, text=True, check=True, timeout=120).stdout
+
+
+def _parse_page_geometry(pdfinfo_out: str) -> Dict[int, dict]:
+	"""Page size (points) and rotation from `pdfinfo -f 1 -l N` output."""
+	pages: Dict[int, dict] = {}
+	for line in pdfinfo_out.splitlines():
+		m = re.match(r"Page\s+(\d+)\s+size:\s+([\d.]+) x ([\d.]+)", line)
+		if m:
+			pages.setdefault(int(m.group(1)), {}).update(width_pt=float(m.group(2)), height_pt=float(m.group(3)))
+			continue
+		m = re.match(r"Page\s+(\d+)\s+rot:\s+(\d+)", line)
+		if m:
+			pages.setdefault(int(m.group(1)), {})["rotation"] = int(m.group(2))
+	return pages
+
+
+def _parse_image_list(pdfimages_out: str) -> Dict[int, List[dict]]:
+	"""Images drawn on each page from `pdfimages -list` output."""
+	pages: Dict[int, List[dict]] = {}
+	rows = pdfimages_out.splitlines()
+	for line in rows[2:]:  # header and dashed rule
+		cols = line.split()
+		if len(cols) < 14 or not cols[0].isdigit():
+			continue
+		try:
+			x_ppi, y_ppi = float(cols[12]), float(cols[13])
+		except ValueError:
+			continue
+		pages.setdefault(int(cols[0]), []).append(dict(
+			type=cols[2],
+			width=int(cols[3]),
+			height=int(cols[4]),
+			color=cols[5],
+			comp=int(cols[6]),
+			enc=cols[8],
+			x_ppi=x_ppi,
+			y_ppi=y_ppi,
+		))
+	return pages
+
+
+def _fills_page(image: dict, geometry: dict, tolerance: float = 0.02) -> bool:
+	# pdfimages derives ppi from the drawn size, so pixels / ppi is the size on the page
+	if image["x_ppi"] <= 0 or image["y_ppi"] <= 0:
+		return False
+	drawn_w = image["width"] / image["x_ppi"] * 72
+	drawn_h = image["height"] / image["y_ppi"] * 72
+	return (
+		abs(drawn_w - geometry["width_pt"]) <= tolerance * geometry["width_pt"]
+		and abs(drawn_h - geometry["height_pt"]) <= tolerance * geometry["height_pt"]
+	)
+
+
+def _has_fonts(pdf_path: str, page: int, poppler_path: Optional[str]) -> bool:
+	out = _run_poppler("pdffonts", ["-f", str(page), "-l", str(page), pdf_path], poppler_path)
+	return len([line for line in out.splitlines() if line.strip()]) > 2
+
+
+def find_single_image_pages(pdf_path: str, page_count: int, poppler_path: Optional[str] = None) -> Set[int]:
+	"""
+	Pages that are exactly one full-page raster (a scanner JPEG wrapped in a
+	page) with no fonts, no rotation and no masks, so their embedded image is
+	what rendering would produce.
+	"""
+	geometry = _parse_page_geometry(_run_poppler("pdfinfo", ["-f", "1", "-l", str(page_count), pdf_path], poppler_path))
+	images = _parse_image_list(_run_poppler("pdfimages", ["-list", pdf_path], poppler_path))
+	pages = set()
+	for page, page_images in images.items():
+		geom = geometry.get(page)
+		if not geom or geom.get("rotation", 0) % 360 or len(page_images) != 1:
+			continue
+		image = page_images[0]
+		if image["type"] != "image" or image["comp"] not in (1, 3) or image["color"] not in ("gray", "rgb", "icc"):
+			continue
+		if not _fills_page(image, geom) or _has_fonts(pdf_path, page, poppler_path):
+			continue
+		pages.add(page)
+	return pages
+
+
+def _extract_page_image(
+	pdf_path: str,
+	page: int,
+	workdir: str,
+	poppler_path: Optional[str],
+	target_width: Optional[int] = None,
+) -> Image.Image:
+	prefix = os.path.join(workdir, f"page{page}")
+	# -j keeps JPEG streams as they are; anything else is written as PNG
+	_run_poppler("pdfimages", ["-f", str(page), "-l", str(page), "-j", "-png", pdf_path, prefix], poppler_path)
+	files = sorted(glob.glob(prefix + "-*"))
+	try:
+		if len(files) != 1:
+			raise ValueError(f"expected one image on page {page}, got {len(files)}")
+		with Image.open(files[0]) as img:
+			if target_width and img.width > target_width:
+				# JPEG can decode straight to a 1/2, 1/4 or 1/8 scale no smaller than this
+				img.draft("RGB", (target_width, max(1, img.height * target_width // img.width)))
+			return img.convert("RGB")
+	finally:
+		for f in files:
+			os.remove(f)
+
+
+def iter_pdf_pages(
+	pdf_bytes: bytes,
+	dpi: int = 300,
+	window: int = 1,
+	target_width: Optional[int] = None,
+	extract_images: bool = False,
+	report: Optional[list] = None,
+) -> Iterator[Image.Image]:
+	"""
+	Rasterize a PDF lazily, `window` pages per poppler call, yielding RGB pages in
+	order. Only the current window is held in memory, so peak usage does not grow
+	with the page count. With target_width, pages are rendered straight at that
+	width instead of at `dpi`, so no full-resolution bitmap is produced only to be
+	downscaled by preprocess_image.
+
+	With extract_images, pages that are a single full-page scan have their embedded
+	image pulled out instead of being re-rendered; mixed or vector pages, and any
+	page whose extraction fails, are rasterized. If given, `report` receives
+	{"page": n, "source": "embedded" | "raster"} for every yielded page.
+	"""
+	from pdf2image import convert_from_path, pdfinfo_from_path
+
+	poppler_path = _get_poppler_path()
+	# Write the bytes once; convert_from_bytes would re-spool them for every window
+	workdir = tempfile.mkdtemp(prefix="pdfpages_")
+	pdf_path = os.path.join(workdir, "input.pdf")
+	try:
+		with open(pdf_path, "wb") as f:
+			f.write(pdf_bytes)
+		page_count = int(pdfinfo_from_path(pdf_path, poppler_path=poppler_path)["Pages"])
+		window = max(1, int(window))
+
+		embedded: Set[int] = set()
+		if extract_images:
+			try:
+				embedded = find_single_image_pages(pdf_path, page_count, poppler_path)
+			except (OSError, subprocess.SubprocessError, ValueError):
+				embedded = set()
+
+		page = 1
+		while page <= page_count:
+			if page in embedded:
+				try:
+					img = _extract_page_image(pdf_path, page, workdir, poppler_path, target_width)
+				except (OSError, subprocess.SubprocessError, ValueError):
+					img = None
+				if img is not None:
+					if report is not None:
+						report.append(dict(page=page, source="embedded"))
+					yield img
+					page += 1
+					continue
+
+			# Rasterize a run of up to `window` pages that have no embedded fast path
+			last = page
+			while last < page_count and last + 1 - page < window and last + 1 not in embedded:
+				last += 1
+			images = convert_from_path(
+				pdf_path,
+				dpi=dpi,
+				first_page=page,
+				last_page=last,
+				size=_render_size(target_width),
+				poppler_path=poppler_path,
+			)
+			for offset, img in enumerate(images):
+				if report is not None:
+					report.append(dict(page=page + offset, source="raster"))
+				yield img.convert("RGB")
+			del images
+			page = last + 1
+	finally:
+		for f in glob.glob(os.path.join(workdir, "*")):
+			try:
+				os.remove(f)
+			except OSError:
+				pass
+		try:
+			os.rmdir(workdir)
+		except OSError:
+			pass
@@ -0,0 +1,92 @@
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, Iterable, List
+
+# tracemalloc is process-global: profilers share one tracing session (started by
+# the first, stopped by the last). Its peak counter is shared too, so a stage's
+# peak is only kept when no other profiler entered while it ran.
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+_tracing_generation = 0  # bumped whenever a profiler enters
+_started_tracing = False
+
+
+def _exclusive_generation():
+	"""The current generation if this thread's profiler is the only one active, else None."""
+	with _tracing_lock:
+		return _tracing_generation if _tracing_users == 1 else None
+
+
+class StageProfiler:
+	"""
+	Records wall time and Python-heap peak for named pipeline stages.
+
+	heap_peak_bytes is what tracemalloc saw above the memory live at stage
+	start: NumPy arrays (including OpenCV results, which are NumPy arrays) but
+	not OpenCV's native scratch buffers, so it is a lower bound on the stage's
+	real memory use. Stages run while another profiled page is in progress in
+	the same process (the request thread with workers=1, or /retune) report
+	time only; stages never wait for each other. Pool workers are separate
+	processes and always measure.
+	"""
+
+	def __init__(self, track_memory: bool = True):
+		self.track_memory = track_memory
+		self.stages: List[Dict] = []
+		self._entered = False
+
+	def __enter__(self) -> "StageProfiler":
+		global _tracing_users, _tracing_generation, _started_tracing
+		if self.track_memory:
+			with _tracing_lock:
+				if _tracing_users == 0 and not tracemalloc.is_tracing():
+					tracemalloc.start()
+					_started_tracing = True
+				_tracing_users += 1
+				_tracing_generation += 1
+			self._entered = True
+		return self
+
+	def __exit__(self, *exc) -> None:
+		global _tracing_users, _started_tracing
+		if not self._entered:
+			return
+		self._entered = False
+		with _tracing_lock:
+			_tracing_users -= 1
+			# Only stop tracing this module started, and only once nobody else is profiling
+			if _tracing_users == 0 and _started_tracing:
+				tracemalloc.stop()
+				_started_tracing = False
+
+	@contextmanager
+	def stage(self, name: str):
+		generation = _exclusive_generation() if self.track_memory and tracemalloc.is_tracing() else None
+		if generation is not None:
+			tracemalloc.reset_peak()
+			base = tracemalloc.get_traced_memory()[0]
+		start = time.perf_counter()
+		try:
+			yield
+		finally:
+			record = dict(stage=name, ms=round((time.perf_counter() - start) * 1000, 2))
+			if generation is not None:
+				peak = tracemalloc.get_traced_memory()[1]
+				# Another profiler entered meanwhile and may have reset the shared peak
+				if _exclusive_generation() == generation:
+					record["heap_peak_bytes"] = max(0, peak - base)
+			self.stages.append(record)
+
+
+def summarize_stages(pages: Iterable[List[Dict]]) -> List[Dict]:
+	"""Aggregate per-page stage records into totals per stage, slowest first."""
+	totals: Dict[str, Dict] = {}
+	for stages in pages:
+		for rec in stages:
+			t = totals.setdefault(rec["stage"], dict(stage=rec["stage"], ms=0.0, heap_peak_bytes=0, pages=0))
+			t["ms"] = round(t["ms"] + rec["ms"], 2)
+			t["heap_peak_bytes"] = max(t["heap_peak_bytes"], rec.get("heap_peak_bytes", 0))
+			t["pages"] += 1
+	return sorted(totals.values(), key=lambda t: t["ms"], reverse=True)
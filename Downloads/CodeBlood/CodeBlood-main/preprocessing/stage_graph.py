@@ -0,0 +1,144 @@
+import inspect
+from collections import namedtuple
+from contextlib import nullcontext
+from typing import Callable, Dict, List, Optional, Set, Union
+
+import numpy as np
+
+from preprocessing.image_utils import (
+	preprocess_image,
+	_resize,
+	_grayscale,
+	_remove_shadow,
+	_apply_clahe,
+	_denoise,
+	_deskew,
+	_threshold,
+	_morphology,
+	_sharpen,
+	_blend,
+	_crop_table,
+)
+from preprocessing.profiling import StageProfiler
+
+
+# inputs/outputs name arrays held by the graph; params name preprocess_image settings
+Stage = namedtuple("Stage", "name fn inputs params outputs")
+
+
+def _shadow_stage(gray: np.ndarray, remove_shadow: bool, shadow_scale: float) -> np.ndarray:
+	return _remove_shadow(gray, shadow_scale) if remove_shadow else gray
+
+
+def _deskew_stage(blur: np.ndarray, deskew: bool, deskew_method: str, deskew_min_angle: float):
+	deskew_info: dict = {}
+	if not deskew:
+		return blur, deskew_info
+	return _deskew(blur, deskew_method, deskew_min_angle, deskew_info), deskew_info
+
+
+STAGES: List[Stage] = [
+	Stage("resize", _resize, ("source",), ("resize_width",), ("img",)),
+	Stage("grayscale", _grayscale, ("img",), (), ("gray",)),
+	Stage("shadow", _shadow_stage, ("gray",), ("remove_shadow", "shadow_scale"), ("unshadowed",)),
+	Stage("clahe", _apply_clahe, ("unshadowed",), ("clahe_clip",), ("contrast",)),
+	Stage("denoise", _denoise, ("contrast",), ("denoise_strength", "denoise_tile", "denoise_workers"), ("blur",)),
+	Stage("deskew", _deskew_stage, ("blur",), ("deskew", "deskew_method", "deskew_min_angle"), ("work", "deskew_info")),
+	Stage("threshold", _threshold, ("work",), ("adaptive_block", "adaptive_c"), ("binary",)),
+	Stage("morphology", _morphology, ("binary",), (), ("clean",)),
+	Stage("sharpen", _sharpen, ("clean",), (), ("sharpened",)),
+	Stage("blend", _blend, ("img", "sharpened", "deskew_info"), (), ("blended",)),
+	Stage("crop", _crop_table, ("blended",), ("crop_table", "table_columns", "table_header_rows"), ("output", "table_grid")),
+]
+
+DEFAULTS = {
+	name: p.default
+	for name, p in inspect.signature(preprocess_image).parameters.items()
+	if p.default is not inspect.Parameter.empty and name not in ("profile", "info")
+}
+
+
+# Arrays a graph keeps between runs: the page after resizing (also blended back in),
+# the denoised page and its deskewed copy. Every other array is dropped after a run
+# and recomputed from the nearest kept one when a later run needs it
+KEPT = ("img", "blur", "work", "deskew_info", "table_grid")
+
+
+class PreprocessGraph:
+	"""
+	preprocess_image for one page as a stage graph. run() recomputes only the
+	stages whose settings changed and the stages downstream of them, so tuning
+	adaptive_c does not repeat shadow removal or denoising. Only the arrays in
+	KEPT stay in memory between runs; the source page is re-read through
+	`source` when it is a loader rather than an array.
+	"""
+
+	def __init__(self, source: Union[np.ndarray, Callable[[], np.ndarray]]):
+		self._load = source if callable(source) else None
+		self.values: Dict[str, object] = {} if self._load else {"source": source}
+		self._params: Dict[str, tuple] = {}
+
+	@property
+	def nbytes(self) -> int:
+		return sum(v.nbytes for v in list(self.values.values()) if isinstance(v, np.ndarray))
+
+	def _plan(self, settings: dict) -> Set[str]:
+		"""Names of the stages the next run has to execute."""
+		producer = {o: stage for stage in STAGES for o in stage.outputs}
+		todo = {
+			stage.name for stage in STAGES
+			if self._params.get(stage.name) != tuple(settings[p] for p in stage.params)
+		}
+		todo.add(STAGES[-1].name)
+		grown = True
+		while grown:
+			grown = False
+			produced = {o for stage in STAGES if stage.name in todo for o in stage.outputs}
+			for stage in STAGES:
+				if stage.name in todo:
+					# A dropped input is recomputed by the stage that produced it
+					needed = {producer[i].name for i in stage.inputs if i in producer and i not in self.values}
+				else:
+					# Stages downstream of a recomputed array run again
+					needed = {stage.name} if produced.intersection(stage.inputs) else set()
+				if needed - todo:
+					todo |= needed
+					grown = True
+		return todo
+
+	def run(self, profile: bool = False, info: Optional[dict] = None, **settings) -> np.ndarray:
+		unknown = set(settings) - set(DEFAULTS)
+		if unknown:
+			raise TypeError(f"Unknown preprocessing settings: {', '.join(sorted(unknown))}")
+		settings = {**DEFAULTS, **settings}
+		todo = self._plan(settings)
+		if "source" not in self.values and STAGES[0].name in todo:
+			self.values["source"] = self._load()
+		profiler = StageProfiler() if profile else None
+		recomputed = []
+		with profiler if profiler is not None else nullcontext():
+			for stage in STAGES:
+				if stage.name not in todo:
+					continue
+				params = tuple(settings[p] for p in stage.params)
+				args = [self.values[i] for i in stage.inputs] + list(params)
+				with profiler.stage(stage.name) if profiler is not None else nullcontext():
+					out = stage.fn(*args)
+				if len(stage.outputs) == 1:
+					out = (out,)
+				self.values.update(zip(stage.outputs, out))
+				self._params[stage.name] = params
+				recomputed.append(stage.name)
+		output = self.values["output"]
+		kept = KEPT if self._load else KEPT + ("source",)
+		self.values = {k: v for k, v in self.values.items() if k in kept}
+
+		if info is not None:
+			info.update(self.values["deskew_info"])
+			info["recomputed"] = recomputed
+			if settings["crop_table"]:
+				grid = self.values["table_grid"]
+				info["table_grid"] = dict(rows=grid["rows"], cols=grid["cols"]) if grid else None
+			if profiler is not None:
+				info["stages"] = profiler.stages
+		return output
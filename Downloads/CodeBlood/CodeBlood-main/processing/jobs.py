@@ -0,0 +1,200 @@
+"""Background jobs for long-running preprocessing and OCR runs"""
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+class EventLog:
+    """
+    Append-only list of progress events for one run. Events get increasing ids
+    so a client can resume a stream from the last id it saw.
+    """
+
+    def __init__(self):
+        self._events: List[dict] = []
+        self._cond = threading.Condition()
+
+    def emit(self, event: str, **data) -> dict:
+        with self._cond:
+            entry = dict(id=len(self._events) + 1, event=event, time=round(time.time(), 3), data=data)
+            self._events.append(entry)
+            self._cond.notify_all()
+            return entry
+
+    @property
+    def last_id(self) -> int:
+        with self._cond:
+            return len(self._events)
+
+    def since(self, last_id: int, timeout: Optional[float] = None) -> List[dict]:
+        """Events after last_id, waiting up to timeout seconds for the next one if there are none yet."""
+        with self._cond:
+            if len(self._events) <= last_id:
+                self._cond.wait(timeout)
+            return self._events[last_id:]
+
+
+class Job:
+    """
+    State of one background job of a run ("preprocess" or "ocr"). The worker
+    thread updates it through the page_* / message methods, which also emit
+    events; request handlers read it through snapshot().
+    """
+
+    def __init__(self, run_id: str, kind: str, events: EventLog):
+        self.run_id = run_id
+        self.kind = kind
+        self.status = "queued"  # queued -> running -> done | failed
+        self.total: Optional[int] = None  # known once every input page has been read
+        self.pages: Dict[int, dict] = {}
+        self.messages: List[tuple] = []
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.events = events
+        self.first_event_id = events.last_id  # events of earlier jobs of the run come before this
+        self._taken = 0  # messages already handed out by take_messages
+        self._error_taken = False
+        self._lock = threading.Lock()
+
+    def set_status(self, status: str, error: Optional[str] = None) -> None:
+        with self._lock:
+            self.status = status
+            self.error = error
+            if status == "running":
+                self.started = time.time()
+            elif status in ("done", "failed"):
+                self.finished = time.time()
+            elapsed = (self.finished or time.time()) - self.started if self.started else 0.0
+        self.events.emit("job", stage=self.kind, status=status, error=error, total=self.total, elapsed_s=round(elapsed, 2))
+
+    def page_update(self, page: int, status: str, **fields) -> None:
+        with self._lock:
+            entry = self.pages.setdefault(page, dict(page=page))
+            entry.update(fields, status=status)
+        self.events.emit("page", stage=self.kind, page=page, status=status, **fields)
+
+    def set_total(self, total: int) -> None:
+        with self._lock:
+            self.total = total
+        self.events.emit("total", stage=self.kind, total=total)
+
+    def message(self, category: str, text: str) -> None:
+        """Queue a message for the page that renders the result (flash() needs a request)."""
+        with self._lock:
+            self.messages.append((category, text))
+        self.events.emit("message", stage=self.kind, category=category, text=text)
+
+    def take_messages(self, failure: str = "Job failed.") -> List[tuple]:
+        """
+        Messages not handed out yet, so the page showing the finished job
+        flashes each one once rather than on every reload. A failed job's error
+        comes last, the first time only.
+        """
+        with self._lock:
+            fresh = self.messages[self._taken:]
+            self._taken = len(self.messages)
+            if self.status == "failed" and not self._error_taken:
+                fresh.append(("error", self.error or failure))
+                self._error_taken = True
+            return fresh
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("done", "failed")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            pages = [dict(self.pages[p]) for p in sorted(self.pages)]
+            now = self.finished or time.time()
+            return dict(
+                run_id=self.run_id,
+                kind=self.kind,
+                status=self.status,
+                total=self.total,
+                completed=sum(1 for p in pages if p["status"] in ("done", "error")),
+                failed=sum(1 for p in pages if p["status"] == "error"),
+                pages=pages,
+                messages=[dict(category=c, text=t) for c, t in self.messages],
+                error=self.error,
+                elapsed_s=round(now - (self.started or now), 2),
+                first_event_id=self.first_event_id,
+            )
+
+
+class JobManager:
+    """
+    Runs jobs on a small thread pool and keeps the most recent ones, one per
+    (run_id, kind), for status queries. All jobs of a run share one EventLog.
+    """
+
+    def __init__(self, workers: int = 2, keep: int = 50):
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="job")
+        self._jobs: "OrderedDict[Tuple[str, str], Job]" = OrderedDict()
+        self._events: Dict[str, EventLog] = {}
+        self._keep = max(1, keep)
+        self._lock = threading.Lock()
+
+    def submit(
+        self, run_id: str, fn: Callable[..., Any], *args, kind: str = "preprocess", exclusive: bool = False, **kwargs
+    ) -> Optional[Job]:
+        """
+        Queue fn(job, *args, **kwargs); its return value becomes job.result.
+        With exclusive=True nothing is queued, and None is returned, while
+        another job of the run is still queued or running.
+        """
+        with self._lock:
+            if exclusive and any(not job.done for (rid, _), job in self._jobs.items() if rid == run_id):
+                return None
+            events = self._events.setdefault(run_id, EventLog())
+            job = Job(run_id, kind, events)
+            self._jobs.pop((run_id, kind), None)
+            self._jobs[(run_id, kind)] = job
+            self._evict()
+        job.set_status("queued")
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def get(self, run_id: str, kind: str = "preprocess") -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get((run_id, kind))
+
+    def forget(self, run_id: str, kind: str) -> None:
+        """Drop a finished job, e.g. once its result no longer matches the run."""
+        with self._lock:
+            job = self._jobs.get((run_id, kind))
+            if job is not None and job.done:
+                del self._jobs[(run_id, kind)]
+
+    def events(self, run_id: str) -> Optional[EventLog]:
+        with self._lock:
+            return self._events.get(run_id)
+
+    def active(self, run_id: str) -> bool:
+        """Whether any job of the run is still queued or running."""
+        with self._lock:
+            return any(not job.done for (rid, _), job in self._jobs.items() if rid == run_id)
+
+    def _run(self, job: Job, fn: Callable[..., Any], args: tuple, kwargs: dict) -> None:
+        job.set_status("running")
+        try:
+            job.result = fn(job, *args, **kwargs)
+        except Exception as e:
+            traceback.print_exc()
+            job.set_status("failed", error=str(e))
+        else:
+            job.set_status("done")
+
+    def _evict(self) -> None:
+        # Only finished jobs are dropped; running ones stay until they complete
+        excess = len(self._jobs) - self._keep
+        for key in [k for k, j in self._jobs.items() if j.done][:max(0, excess)]:
+            del self._jobs[key]
+        live = {rid for rid, _ in self._jobs}
+        for run_id in [r for r in self._events if r not in live]:
+            del self._events[run_id]
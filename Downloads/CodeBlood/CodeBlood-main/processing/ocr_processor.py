@@ -7,13 +7,15 @@ import tempfile
 import streamlit as st
 
 from ..gemini import gemini_ocr_extract
+from ..ocr.backends import OCRBackend, get_backend
 from .normalizer import AttendanceNormalizer
 from .validator import AttendanceValidator
 
 
 class OCRProcessor:
-    def __init__(self, master_list_path: Path, api_key: Optional[str] = None):
+    def __init__(self, master_list_path: Path, api_key: Optional[str] = None, backend: Optional[OCRBackend] = None):
         self.api_key = api_key or os.getenv("GEMINI_API_KEY")
+        self.backend = backend or get_backend()
         self.normalizer = AttendanceNormalizer()
         self.validator = AttendanceValidator(master_list_path)
         self.temp_dir = Path(tempfile.mkdtemp())
@@ -27,11 +29,12 @@ class OCRProcessor:
                 str(image_path),
                 api_key=self.api_key,
                 csv_path=str(csv_path),
-                model="gemini-2.5-flash"
+                model="gemini-2.5-flash",
+                backend=self.backend
             )
 
             if not result_path or not os.path.exists(result_path):
-                return False, "Failed to process image with Gemini OCR", None
+                return False, f"Failed to process image with {self.backend.name} OCR", None
 
             # Load and validate the extracted data
             df = pd.read_csv(result_path)
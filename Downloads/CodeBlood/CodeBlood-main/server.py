@@ -1,12 +1,20 @@
 import os
-import io
+import json
+import multiprocessing
 import uuid
+import shutil
+import tempfile
 import zipfile
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-from typing import List
+from typing import Iterator, List, Optional, Tuple
 from dotenv import load_dotenv
 
-from flask import Flask, render_template, request, redirect, url_for, send_file, send_from_directory, flash, jsonify
+from flask import Flask, Response, abort, render_template, request, redirect, url_for, send_file, send_from_directory, flash, jsonify, stream_with_context
 from werkzeug.utils import secure_filename
 from PIL import Image
 import pandas as pd
@@ -14,15 +22,28 @@ import pandas as pd
 # Load environment variables
 load_dotenv()
 
-from preprocessing.pdf_utils import convert_pdf_to_images
+from preprocessing.pdf_utils import convert_pdf_to_images, iter_pdf_pages
 from preprocessing.image_utils import (
 	convert_pil_to_cv,
 	convert_cv_to_pil,
 	preprocess_image,
 	detect_and_crop_table_region,
 )
-from config import PREPROCESSING, APP_NAME
-from gemini import gemini_ocr_extract
+from preprocessing.batch import iter_preprocessed, resolve_denoise_workers
+from preprocessing.cache import PageCache
+from preprocessing.profiling import summarize_stages
+from preprocessing.stage_graph import PreprocessGraph, STAGES
+from preprocessing.page_filter import classify_pages
+from processing.jobs import Job, JobManager
+from storage.retention import RunStorage
+from storage.run_index import RunIndex, file_sha256
+from storage.zipstream import iter_zip
+from config import PREPROCESSING, PAGE_CACHE, PAGE_FILTER, JOBS, OCR, OCR_UPLOAD, STORAGE, APP_NAME
+from gemini import DEFAULT_MODEL, gemini_ocr_extract, gemini_ocr_extract_batch, ocr_fingerprint
+from ocr.backends import get_backend
+from ocr.cache import get_cache
+from ocr.encoding import upload_stats
+from ocr.ratelimit import get_limiter
 
 
 # APP_NAME imported from config
@@ -33,20 +54,118 @@ UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'zip', 'jpg', 'jpeg', 'png'}
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+page_cache = PageCache(PAGE_CACHE["dir"], PAGE_CACHE["max_bytes"]) if PAGE_CACHE.get("enabled") else None
+
+# run_id -> [PreprocessGraph per page] for interactive re-tuning, least recently tuned first
+_run_graphs: "OrderedDict[str, List[PreprocessGraph]]" = OrderedDict()
+_graphs_lock = threading.Lock()
+STAGE_NAMES = [stage.name for stage in STAGES]
+
+# Background preprocessing runs submitted through /process
+jobs = JobManager(workers=JOBS.get("workers", 2), keep=JOBS.get("keep", 50))
+
+# Settings, pages and OCR artefacts of every run, looked up by run_id
+run_index = RunIndex(STORAGE["index_path"])
+
+
+def _forget_run_graphs(run_id: str) -> None:
+	with _graphs_lock:
+		_run_graphs.pop(run_id, None)
+
+
+# Age/size limits and compaction for RUNS_DIR, applied on a background thread
+run_storage = RunStorage(
+	RUNS_DIR,
+	run_index,
+	max_age_days=STORAGE.get("max_age_days", 0),
+	max_bytes=STORAGE.get("max_bytes", 0),
+	compact_after_days=STORAGE.get("compact_after_days", 0),
+	interval_s=STORAGE.get("sweep_interval_s", 3600),
+	is_active=jobs.active,
+	on_remove=_forget_run_graphs,
+)
+
+
+def _start_retention() -> None:
+	# Never at import: spawned page workers re-import this module as __mp_main__
+	if STORAGE.get("retention") and multiprocessing.parent_process() is None:
+		run_storage.start()
+
+
+def _lookup_run(run_id: str) -> Optional[dict]:
+	"""
+	Index entry of a run. Runs written before the index existed are imported,
+	and compacted runs unpacked, on first access.
+	"""
+	run = run_index.get_run(run_id)
+	if run is None and run_id and run_id == secure_filename(run_id):
+		run = run_index.import_run_dir(run_id, os.path.join(RUNS_DIR, run_id))
+	if run is not None and run.get("archive"):
+		run = run_index.get_run(run_id) if run_storage.restore(run_id) else None
+	return run
+
+
 app = Flask(__name__)
 app.secret_key = 'audtiflow_secret_key_2024'
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
 
-def _save_images(images: List[Image.Image], base_dir: str, prefix: str) -> List[str]:
+@app.before_request
+def _start_background_tasks():
+	"""
+	Start the retention sweeper with the first request a process serves. Only
+	a serving process gets here: not the debug reloader's watching parent, nor
+	a page worker that imported this module.
+	"""
+	_start_retention()
+
+
+@app.before_request
+def _restore_compacted_run():
+	"""Image URLs under /static/runs point into run directories; unpack a compacted run before they are served."""
+	if request.endpoint == "static":
+		parts = (request.view_args or {}).get("filename", "").split("/")
+		if len(parts) > 2 and parts[0] == os.path.basename(RUNS_DIR):
+			_lookup_run(parts[1])
+
+
+def _save_image(img: Image.Image, base_dir: str, prefix: str, idx: int) -> str:
 	os.makedirs(base_dir, exist_ok=True)
-	paths = []
-	for idx, img in enumerate(images, start=1):
-		fname = f"{prefix}_{idx:02d}.png"
-		fpath = os.path.join(base_dir, fname)
-		img.save(fpath)
-		paths.append(fpath.replace("\\", "/"))
-	return paths
+	fpath = os.path.join(base_dir, f"{prefix}_{idx:02d}.png")
+	img.save(fpath)
+	return fpath.replace("\\", "/")
+
+
+def _iter_uploaded_pages(uploads, target_width: Optional[int] = None, notify=None) -> Iterator[Tuple[Image.Image, str]]:
+	"""
+	Yield (page, source) for uploaded (filename, path) pairs one at a time,
+	rasterizing PDFs lazily (at target_width when given); read errors are
+	reported per file through notify(category, message). source is "image" for
+	uploaded images, "pdf-embedded" for scanned PDF pages whose image was
+	extracted directly and "pdf-raster" for rendered PDF pages.
+	"""
+	for name, path in uploads:
+		try:
+			if name.lower().endswith(".pdf"):
+				with open(path, "rb") as f:
+					pdf_bytes = f.read()
+				report: List[dict] = []
+				pages = iter_pdf_pages(
+					pdf_bytes,
+					window=PREPROCESSING.get("pdf_window", 1),
+					target_width=target_width,
+					extract_images=PREPROCESSING.get("pdf_extract_images", False),
+					report=report,
+				)
+				for img in pages:
+					yield img, f"pdf-{report[-1]['source']}"
+			else:
+				with Image.open(path) as img:
+					yield img.convert("RGB"), "image"
+		except Exception as e:
+			if notify:
+				notify("error", f"Error reading file {name}: {str(e)}")
+			continue
 
 
 @app.route("/", methods=["GET"]) 
@@ -62,129 +181,468 @@ def dashboard():
 		input_images=[],
 		cleaned_images=[],
 		run_id=None,
-		settings=dict(
-			resize_width=PREPROCESSING["resize_width"],
-			adaptive_block=PREPROCESSING["adaptive_block"],
-			adaptive_c=PREPROCESSING["adaptive_c"],
-			deskew=PREPROCESSING["deskew"],
-			crop_table=PREPROCESSING["crop_table"],
-			remove_shadow=PREPROCESSING["remove_shadow"],
-			clahe_clip=PREPROCESSING["clahe_clip"],
-			denoise_strength=PREPROCESSING["denoise_strength"]
-		),
+		settings=_default_settings(),
+	)
+
+
+def _default_settings() -> dict:
+	return dict(
+		resize_width=PREPROCESSING["resize_width"],
+		adaptive_block=PREPROCESSING["adaptive_block"],
+		adaptive_c=PREPROCESSING["adaptive_c"],
+		deskew=PREPROCESSING["deskew"],
+		crop_table=PREPROCESSING["crop_table"],
+		remove_shadow=PREPROCESSING["remove_shadow"],
+		clahe_clip=PREPROCESSING["clahe_clip"],
+		denoise_strength=PREPROCESSING["denoise_strength"],
+		profile=PREPROCESSING["profile"],
+	)
+
+
+def _read_settings(form) -> dict:
+	"""Preprocessing settings posted by the dashboard form."""
+	return dict(
+		resize_width=int(form.get("resize_width", 1500)),
+		adaptive_block=int(form.get("adaptive_block", 35)),
+		adaptive_c=int(form.get("adaptive_c", 5)),
+		deskew=form.get("deskew") == "on",
+		crop_table=form.get("crop_table") == "on",
+		remove_shadow=form.get("remove_shadow", "on") == "on",
+		clahe_clip=float(form.get("clahe_clip", 0)),
+		denoise_strength=int(form.get("denoise_strength", 0)),
+		profile=form.get("profile") == "on" or bool(PREPROCESSING.get("profile")),
+	)
+
+
+def _preprocess_kwargs(settings: dict) -> dict:
+	"""Keyword arguments for preprocess_image from dashboard settings."""
+	return dict(
+		resize_width=settings["resize_width"],
+		adaptive_block=settings["adaptive_block"],
+		adaptive_c=settings["adaptive_c"],
+		deskew=settings["deskew"],
+		remove_shadow=settings["remove_shadow"],
+		clahe_clip=settings["clahe_clip"],
+		denoise_strength=settings["denoise_strength"],
+		crop_table=settings["crop_table"],
+		table_columns=PREPROCESSING.get("table_columns"),
+		table_header_rows=PREPROCESSING.get("table_header_rows", 0),
+		deskew_method=PREPROCESSING.get("deskew_method", "minarea"),
+		deskew_min_angle=PREPROCESSING.get("deskew_min_angle", 0.0),
+		denoise_tile=PREPROCESSING.get("denoise_tile", 0),
+		denoise_workers=resolve_denoise_workers(PREPROCESSING.get("denoise_workers", 0), PREPROCESSING.get("workers", 0)),
+		shadow_scale=PREPROCESSING.get("shadow_scale", 1.0),
+	)
+
+
+def _log_profile(run_id: str, settings: dict, page_info: List[dict]) -> List[dict]:
+	"""Print the per-stage profile of a run as one JSON line and return the totals."""
+	stage_profile = summarize_stages([p["stages"] for p in page_info if "stages" in p])
+	print(json.dumps(dict(
+		event="preprocess_profile",
+		run_id=run_id,
+		settings=_preprocess_kwargs(settings),
+		pages=[dict(page=p["page"], cache=p.get("cache"), stages=p.get("stages", [])) for p in page_info],
+		totals=stage_profile,
+	)), flush=True)
+	return stage_profile
+
+
+def _render_run(run_id: str, settings: dict, input_paths: List[str], clean_paths: List[str], page_info: List[dict], stage_profile=None):
+	metrics = dict(
+		uploaded=len(input_paths),
+		processed=len(clean_paths),
+		last_run=datetime.now().strftime("%d-%b %Y %I:%M %p"),
+	)
+	return render_template(
+		"dashboard.html",
+		app_name=APP_NAME,
+		metrics=metrics,
+		input_images=["/" + p for p in input_paths],
+		cleaned_images=["/" + p for p in clean_paths],
+		page_info=page_info,
+		stage_profile=stage_profile,
+		run_id=run_id,
+		settings=settings,
+	)
+
+
+def _run_preprocess(job: Job, upload_dir: str, uploads: List[Tuple[str, str]], settings: dict) -> dict:
+	"""Background body of /process: read, preprocess and save every uploaded page of a run."""
+	run_id = job.run_id
+	run_dir = os.path.join(RUNS_DIR, run_id)
+	input_paths: List[str] = []
+	sources: List[str] = []
+	run_index.create_run(run_id, settings)
+	try:
+		def input_arrays():
+			# Pages are saved and handed to the workers as they are read, so only
+			# the pages in flight are held in memory
+			for img, source in _iter_uploaded_pages(uploads, target_width=settings["resize_width"], notify=job.message):
+				sources.append(source)
+				input_paths.append(_save_image(img, os.path.join(run_dir, "input"), "input", len(input_paths) + 1))
+				run_index.put_page(run_id, len(input_paths), source=source, input_path=input_paths[-1], input_hash=file_sha256(input_paths[-1]))
+				job.page_update(len(input_paths), "queued", source=source)
+				yield convert_pil_to_cv(img)
+			job.set_total(len(input_paths))
+
+		results = iter_preprocessed(
+			input_arrays(),
+			workers=PREPROCESSING.get("workers", 0),
+			cache=page_cache,
+			profile=settings["profile"],
+			**_preprocess_kwargs(settings),
+		)
+		clean_paths: List[str] = []
+		page_info = []
+		for idx, cv_processed, error, info in results:
+			if error:
+				job.page_update(idx + 1, "error", error=error)
+				job.message("error", f"Image processing error on page {idx + 1}: {error}")
+				continue
+			# Named after the input page, so a failed page leaves a gap rather than shifting later pages
+			clean_paths.append(_save_image(convert_cv_to_pil(cv_processed), os.path.join(run_dir, "cleaned"), "cleaned", idx + 1))
+			page_info.append(dict(page=idx + 1, source=sources[idx], **info))
+			run_index.put_page(run_id, idx + 1, clean_path=clean_paths[-1], clean_hash=file_sha256(clean_paths[-1]), **info)
+			job.page_update(
+				idx + 1,
+				"done",
+				ms=info.get("ms"),
+				cache=info.get("cache"),
+				deskew_angle=info.get("deskew_angle"),
+				stages=info.get("stages"),
+			)
+	finally:
+		shutil.rmtree(upload_dir, ignore_errors=True)
+
+	if not input_paths:
+		shutil.rmtree(run_dir, ignore_errors=True)
+		run_index.delete_run(run_id)
+		raise ValueError("No valid files found.")
+	if not clean_paths:
+		shutil.rmtree(run_dir, ignore_errors=True)
+		run_index.delete_run(run_id)
+		raise ValueError("No images were successfully processed.")
+
+	run_index.update_run(run_id, status="done")
+	stage_profile = _log_profile(run_id, settings, page_info) if settings["profile"] else None
+	job.message("success", f"Successfully processed {len(clean_paths)} pages.")
+	return dict(
+		settings=settings,
+		input_paths=input_paths,
+		clean_paths=clean_paths,
+		page_info=page_info,
+		stage_profile=stage_profile,
 	)
 
 
 @app.route("/process", methods=["POST"]) 
 def process():
+	"""Queue a preprocessing run and return its run_id; the pages are processed in the background."""
+	wants_json = request.accept_mimetypes.best == "application/json"
 	try:
 		files = request.files.getlist("files")
-		resize_width = int(request.form.get("resize_width", 1500))
-		adaptive_block = int(request.form.get("adaptive_block", 35))
-		adaptive_c = int(request.form.get("adaptive_c", 5))
-		deskew = request.form.get("deskew") == "on"
-		crop_table = request.form.get("crop_table") == "on"
-		remove_shadow = request.form.get("remove_shadow", "on") == "on"
-		clahe_clip = float(request.form.get("clahe_clip", 0))
-		denoise_strength = int(request.form.get("denoise_strength", 0))
+		settings = _read_settings(request.form)
 
 		if not files or all(f.filename == '' for f in files):
+			if wants_json:
+				return jsonify(error="Please upload at least one file."), 400
 			flash("Please upload at least one file.", "error")
 			return redirect(url_for("dashboard"))
 
-		# Read and expand inputs
-		input_pages: List[Image.Image] = []
-		for up in files:
+		# Uploads are spooled to disk so the job can outlive the request
+		run_id = uuid.uuid4().hex[:8]
+		upload_dir = tempfile.mkdtemp(prefix=f"run_{run_id}_")
+		uploads: List[Tuple[str, str]] = []
+		for i, up in enumerate(files):
 			if up.filename == '':
 				continue
-			filename = (up.filename or "").lower()
-			try:
-				if filename.endswith(".pdf"):
-					input_pages.extend(convert_pdf_to_images(up.read()))
-				else:
-					up.stream.seek(0)
-					img = Image.open(up.stream).convert("RGB")
-					input_pages.append(img)
-			except Exception as e:
-				flash(f"Error reading file {up.filename}: {str(e)}", "error")
-				continue
+			path = os.path.join(upload_dir, f"{i:03d}_{secure_filename(up.filename) or 'upload'}")
+			up.save(path)
+			uploads.append((up.filename, path))
 
-		if not input_pages:
-			flash("No valid files found.", "error")
-			return redirect(url_for("dashboard"))
+		jobs.submit(run_id, _run_preprocess, upload_dir, uploads, settings)
+		if wants_json:
+			return jsonify(
+				run_id=run_id,
+				status_url=url_for("run_status", run_id=run_id),
+				events_url=url_for("run_events", run_id=run_id),
+				run_url=url_for("run_view", run_id=run_id),
+			), 202
+		return redirect(url_for("run_view", run_id=run_id))
+	except Exception as e:
+		if wants_json:
+			return jsonify(error=f"Server error: {str(e)}"), 500
+		flash(f"Server error: {str(e)}", "error")
+		return redirect(url_for("dashboard"))
 
-		# Process
-		cleaned_pages: List[Image.Image] = []
-		for img in input_pages:
-			try:
-				cv_img = convert_pil_to_cv(img)
-				cv_processed = preprocess_image(
-					cv_img,
-					resize_width=resize_width,
-					adaptive_block=adaptive_block,
-					adaptive_c=adaptive_c,
-					deskew=deskew,
-					remove_shadow=remove_shadow,
-					clahe_clip=clahe_clip,
-					denoise_strength=denoise_strength,
-				)
-				cleaned_pages.append(convert_cv_to_pil(cv_processed))
-			except Exception as e:
-				flash(f"Image processing error: {str(e)}", "error")
-				continue
 
-		if not cleaned_pages:
-			flash("No images were successfully processed.", "error")
-			return redirect(url_for("dashboard"))
+@app.route("/api/runs/<run_id>", methods=["GET"])
+def run_status(run_id: str):
+	"""Progress of a run's preprocessing (or ?kind=ocr) job: overall status plus the state of every page so far."""
+	job = jobs.get(run_id, kind=request.args.get("kind", "preprocess"))
+	if job is None:
+		return jsonify(error="Unknown run"), 404
+	return jsonify(job.snapshot())
 
-		# Persist run for previews and downloads
-		run_id = uuid.uuid4().hex[:8]
-		run_dir = os.path.join(RUNS_DIR, run_id)
-		input_paths = _save_images(input_pages, os.path.join(run_dir, "input"), "input")
-		clean_paths = _save_images(cleaned_pages, os.path.join(run_dir, "cleaned"), "cleaned")
-
-		metrics = dict(
-			uploaded=len(input_pages),
-			processed=len(cleaned_pages),
-			last_run=datetime.now().strftime("%d-%b %Y %I:%M %p"),
-		)
 
-		flash(f"Successfully processed {len(cleaned_pages)} pages.", "success")
+@app.route("/api/runs/<run_id>/events", methods=["GET"])
+def run_events(run_id: str):
+	"""
+	Stream the progress events of a run as server-sent events, or as NDJSON with
+	?format=ndjson. Replays from ?after=<id> (or Last-Event-ID) and ends once no
+	job of the run is running.
+	"""
+	log = jobs.events(run_id)
+	if log is None:
+		return jsonify(error="Unknown run"), 404
+	try:
+		after = int(request.headers.get("Last-Event-ID") or request.args.get("after") or 0)
+	except ValueError:
+		after = 0
+	ndjson = request.args.get("format") == "ndjson"
+
+	def generate():
+		last_id = after
+		while True:
+			batch = log.since(last_id, timeout=15)
+			for entry in batch:
+				last_id = entry["id"]
+				if ndjson:
+					yield json.dumps(entry) + "\n"
+				else:
+					yield f"id: {entry['id']}\nevent: {entry['event']}\ndata: {json.dumps(entry['data'])}\n\n"
+			if not jobs.active(run_id) and log.last_id <= last_id:
+				break
+			if not batch and not ndjson:
+				yield ": keep-alive\n\n"
+
+	return Response(
+		stream_with_context(generate()),
+		mimetype="application/x-ndjson" if ndjson else "text/event-stream",
+		headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+	)
+
+
+@app.route("/runs/<run_id>", methods=["GET"])
+def run_view(run_id: str):
+	"""Dashboard for a run: live progress while it is processing, the results once it has finished."""
+	job = jobs.get(run_id)
+	if job is None:
+		return _render_saved_run(run_id)
+	if not job.done:
 		return render_template(
 			"dashboard.html",
 			app_name=APP_NAME,
-			metrics=metrics,
-			input_images=["/" + p for p in input_paths],
-			cleaned_images=["/" + p for p in clean_paths],
-			run_id=run_id,
-			settings=dict(
-				resize_width=resize_width,
-				adaptive_block=adaptive_block,
-				adaptive_c=adaptive_c,
-				deskew=deskew,
-				crop_table=crop_table,
-				remove_shadow=remove_shadow,
-				clahe_clip=clahe_clip,
-				denoise_strength=denoise_strength,
-			),
+			metrics=dict(uploaded=len(job.pages), processed=0, last_run="—"),
+			input_images=[],
+			cleaned_images=[],
+			run_id=None,
+			job=job.snapshot(),
+			events_url=url_for("run_events", run_id=run_id, after=job.first_event_id),
+			settings=_default_settings(),
 		)
+	for category, text in job.take_messages(failure="Processing failed."):
+		flash(text, category)
+	if job.status == "failed":
+		return redirect(url_for("dashboard"))
+	r = job.result
+	return _render_run(run_id, r["settings"], r["input_paths"], r["clean_paths"], r["page_info"], r["stage_profile"])
+
+
+def _render_saved_run(run_id: str):
+	"""Render a run that is no longer tracked in memory from its entry in the run index."""
+	run = _lookup_run(run_id)
+	if run is None or not run["page_count"]:
+		flash("Invalid run. Please preprocess images first.", "error")
+		return redirect(url_for("dashboard"))
+	pages = run_index.pages(run_id)
+	page_info = [p for p in pages if p.get("clean_path")]
+	return _render_run(
+		run_id,
+		dict(_default_settings(), **run["settings"]),
+		[p["input_path"] for p in pages if p.get("input_path")],
+		[p["clean_path"] for p in page_info],
+		page_info,
+	)
+
+
+def _get_run_graphs(run_id: str) -> Optional[List[PreprocessGraph]]:
+	"""Stage graphs for the input pages of a run; pages are read from disk on their first run."""
+	with _graphs_lock:
+		if run_id in _run_graphs:
+			_run_graphs.move_to_end(run_id)
+			return _run_graphs[run_id]
+	if _lookup_run(run_id) is None:
+		return None
+	graphs = [
+		PreprocessGraph(lambda path=path: convert_pil_to_cv(Image.open(path).convert("RGB")))
+		for path in run_index.input_paths(run_id)
+	]
+	with _graphs_lock:
+		return _run_graphs.setdefault(run_id, graphs)
+
+
+def _trim_run_graphs() -> None:
+	"""Drop the graphs of the least recently tuned runs until the rest fit in graph_max_bytes."""
+	with _graphs_lock:
+		sizes = {run_id: sum(g.nbytes for g in graphs) for run_id, graphs in _run_graphs.items()}
+		total = sum(sizes.values())
+		while _run_graphs and total > PREPROCESSING.get("graph_max_bytes", 512 * 1024 * 1024):
+			run_id, _ = _run_graphs.popitem(last=False)
+			total -= sizes[run_id]
+
+
+def _run_retune(job: Job, settings: dict) -> dict:
+	"""Background body of /retune: re-run preprocessing on a run's pages, recomputing only the stages whose settings changed."""
+	# Sweeps wait rather than compact or delete the run while its pages are rewritten
+	with run_storage.hold(job.run_id):
+		return _retune_pages(job, settings)
+
+
+def _retune_pages(job: Job, settings: dict) -> dict:
+	run_id = job.run_id
+	graphs = _get_run_graphs(run_id)
+	if not graphs:
+		raise ValueError("Invalid run. Please preprocess images first.")
+	job.set_total(len(graphs))
+	for idx in range(len(graphs)):
+		job.page_update(idx + 1, "queued")
+
+	run_dir = os.path.join(RUNS_DIR, run_id)
+	old_hashes = {p["page"]: p.get("clean_hash") for p in run_index.pages(run_id)}
+	page_info = []
+	changed = []
+	try:
+		for idx, graph in enumerate(graphs):
+			job.page_update(idx + 1, "running")
+			info: dict = {}
+			start = time.perf_counter()
+			try:
+				cleaned = graph.run(profile=settings["profile"], info=info, **_preprocess_kwargs(settings))
+			except Exception as e:
+				# The page keeps its previous cleaned image
+				job.page_update(idx + 1, "error", error=str(e))
+				job.message("error", f"Image processing error on page {idx + 1}: {str(e)}")
+				continue
+			info["ms"] = round((time.perf_counter() - start) * 1000, 1)
+			path = _save_image(convert_cv_to_pil(cleaned), os.path.join(run_dir, "cleaned"), "cleaned", idx + 1)
+			clean_hash = file_sha256(path)
+			if clean_hash != old_hashes.get(idx + 1):
+				changed.append(os.path.basename(path))
+			run_index.put_page(run_id, idx + 1, clean_path=path, clean_hash=clean_hash, **info)
+			page_info.append(dict(page=idx + 1, **info))
+			job.page_update(idx + 1, "done", ms=info["ms"], deskew_angle=info.get("deskew_angle"), stages=info.get("stages"))
+	finally:
+		_trim_run_graphs()
+
+	if page_info:
+		run_index.update_run(run_id, settings=settings)
+		recomputed = sorted({s for p in page_info for s in p.get("recomputed", [])}, key=STAGE_NAMES.index)
+		job.message("success", f"Re-ran {', '.join(recomputed) or 'no stages'} on {len(page_info)} pages.")
+	else:
+		job.message("error", "No images were successfully processed.")
+	# OCR read the old images of these pages
+	run_index.mark_ocr_stale(run_id, changed)
+	if changed:
+		jobs.forget(run_id, "ocr")
+	return dict(
+		settings=settings,
+		input_paths=run_index.input_paths(run_id),
+		clean_paths=run_index.clean_paths(run_id),
+		page_info=page_info,
+		stage_profile=_log_profile(run_id, settings, page_info) if settings["profile"] and page_info else None,
+	)
+
+
+@app.route("/retune/<run_id>", methods=["POST"])
+def retune(run_id: str):
+	"""Queue a re-run of preprocessing on an existing run and show its progress."""
+	try:
+		settings = _read_settings(request.form)
+		if _lookup_run(run_id) is None or not run_index.input_paths(run_id):
+			flash("Invalid run. Please preprocess images first.", "error")
+			return redirect(url_for("dashboard"))
+		# Replaces the run's preprocess job, so run_view shows the re-tuned pages
+		if jobs.submit(run_id, _run_retune, settings, kind="preprocess", exclusive=True) is None:
+			flash("This run is still being processed. Try again once it has finished.", "error")
+		return redirect(url_for("run_view", run_id=run_id))
 	except Exception as e:
 		flash(f"Server error: {str(e)}", "error")
 		return redirect(url_for("dashboard"))
 
 
+def _zip_response(chunks: Iterator[bytes], download_name: str) -> Response:
+	"""Send a ZIP archive as it is built instead of buffering it first."""
+	return Response(
+		chunks,
+		mimetype="application/zip",
+		headers={"Content-Disposition": f'attachment; filename="{download_name}"'},
+	)
+
+
 @app.route("/download/<run_id>.zip", methods=["GET"]) 
 def download_zip(run_id: str):
-	run_dir = os.path.join(RUNS_DIR, run_id, "cleaned")
-	if not os.path.isdir(run_dir):
+	clean_paths = run_index.clean_paths(run_id) if _lookup_run(run_id) else []
+	if not clean_paths:
 		return redirect(url_for("index"))
-	buffer = io.BytesIO()
-	with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zipf:
-		for fname in sorted(os.listdir(run_dir)):
-			fpath = os.path.join(run_dir, fname)
-			zipf.write(fpath, arcname=fname)
-	buffer.seek(0)
-	return send_file(buffer, as_attachment=True, download_name="cleaned_attendance_pages.zip", mimetype="application/zip")
+	return _zip_response(iter_zip((os.path.basename(p), p) for p in clean_paths), "cleaned_attendance_pages.zip")
+
+
+@app.route("/api/runs", methods=["GET"])
+def run_history():
+	"""Most recent runs from the run index, newest first (?limit=, ?offset=)."""
+	limit = min(max(request.args.get("limit", 50, type=int), 1), 500)
+	offset = max(request.args.get("offset", 0, type=int), 0)
+	return jsonify(runs=run_index.list_runs(limit=limit, offset=offset))
+
+
+@app.route("/api/storage", methods=["GET"])
+def storage_stats():
+	"""Limits of the run storage and the outcome of its last sweep."""
+	return jsonify(
+		enabled=bool(STORAGE.get("retention")),
+		max_age_days=STORAGE.get("max_age_days", 0),
+		max_bytes=STORAGE.get("max_bytes", 0),
+		compact_after_days=STORAGE.get("compact_after_days", 0),
+		last_sweep=run_storage.last_report,
+	)
+
+
+@app.route("/api/page-cache", methods=["GET"])
+def page_cache_stats():
+	"""Hit/miss counters and size of the cleaned-page cache."""
+	if page_cache is None:
+		return jsonify(enabled=False)
+	return jsonify(enabled=True, **page_cache.stats())
+
+
+@app.route("/api/ocr-cache", methods=["GET"])
+def ocr_cache_stats():
+	"""Hit/miss counters and size of the OCR result cache."""
+	cache = get_cache()
+	if cache is None:
+		return jsonify(enabled=False)
+	return jsonify(enabled=True, **cache.stats())
+
+
+@app.route("/api/ocr-backend", methods=["GET"])
+def ocr_backend_stats():
+	"""Which OCR backend is in use and its request counters."""
+	backend = get_backend()
+	return jsonify(name=backend.name, batch=backend.supports_batch, **backend.stats())
+
+
+@app.route("/api/ocr-limits", methods=["GET"])
+def ocr_limit_stats():
+	"""Rate limiter and adaptive concurrency state: queue depth, time spent throttled, current limit."""
+	return jsonify(get_limiter().stats())
+
+
+@app.route("/api/ocr-upload", methods=["GET"])
+def ocr_upload_stats():
+	"""Upload encoding settings and the page bytes before and after encoding since startup."""
+	return jsonify(settings=OCR_UPLOAD, **upload_stats())
 
 
 def allowed_file(filename):
@@ -241,7 +699,8 @@ def upload_file():
 			output_csv = gemini_ocr_extract(
 				image_path,
 				api_key=api_key,
-				csv_path=os.path.join(app.config['UPLOAD_FOLDER'], 'attendance.csv')
+				csv_path=os.path.join(app.config['UPLOAD_FOLDER'], 'attendance.csv'),
+				backend=get_backend()
 			)
 			
 			if not output_csv:
@@ -266,103 +725,304 @@ def upload_file():
 		return redirect(url_for('ocr_dashboard'))
 
 
-@app.route('/ocr-batch/<run_id>', methods=['GET'])
-def ocr_batch(run_id: str):
-	"""Run OCR on all cleaned images for a given run and render multi-result dashboard."""
-	run_dir = os.path.join(RUNS_DIR, run_id)
-	cleaned_dir = os.path.join(run_dir, 'cleaned')
-	
-	print(f"🔍 OCR batch started for run_id: {run_id}")
-	print(f"📁 Cleaned dir: {cleaned_dir}")
-	print(f"📁 Dir exists: {os.path.isdir(cleaned_dir)}")
-	
-	if not os.path.isdir(cleaned_dir):
-		flash('Invalid run. Please preprocess images first.', 'error')
-		return redirect(url_for('dashboard'))
+# (fname, csv_path, error, ms, upload record from encode_for_upload)
+OCRPageResult = Tuple[str, Optional[str], Optional[str], float, dict]
+
+
+def _ocr_page(cleaned_dir: str, csv_dir: str, fname: str, api_key: str, use_cache: bool = True) -> OCRPageResult:
+	"""OCR one cleaned page into its CSV; failures are returned rather than raised so they stay with their page."""
+	image_path = os.path.join(cleaned_dir, fname)
+	csv_path = os.path.join(csv_dir, os.path.splitext(fname)[0] + '.csv')
+	upload: dict = {}
+	start = time.perf_counter()
+	try:
+		out_csv = gemini_ocr_extract(
+			image_path, api_key=api_key, csv_path=csv_path, use_cache=use_cache, report=upload, backend=get_backend()
+		)
+	except Exception as e:
+		print(f"❌ OCR error for {fname}: {e}")
+		traceback.print_exc()
+		return fname, None, str(e), round((time.perf_counter() - start) * 1000, 1), upload
+	ms = round((time.perf_counter() - start) * 1000, 1)
+	if not out_csv:
+		print(f"⚠️ OCR returned no rows for {fname} ({ms / 1000:.1f}s)")
+		return fname, None, "no rows returned", ms, upload
+	print(f"✅ OCR completed for {fname} ({ms / 1000:.1f}s)")
+	return fname, out_csv, None, ms, upload
+
+
+def _ocr_pages(cleaned_dir: str, csv_dir: str, fnames: List[str], api_key: str, use_cache: bool = True) -> List[OCRPageResult]:
+	"""
+	OCR a group of cleaned pages with one request (see OCR["batch_size"]); same
+	per-page tuples as _ocr_page, with the request time split evenly across the pages.
+	"""
+	if len(fnames) == 1:
+		return [_ocr_page(cleaned_dir, csv_dir, fnames[0], api_key, use_cache)]
+	image_paths = [os.path.join(cleaned_dir, f) for f in fnames]
+	csv_paths = [os.path.join(csv_dir, os.path.splitext(f)[0] + '.csv') for f in fnames]
+	uploads: List[dict] = [{} for _ in fnames]
+	start = time.perf_counter()
+	try:
+		out_csvs = gemini_ocr_extract_batch(
+			image_paths,
+			csv_paths,
+			api_key=api_key,
+			use_cache=use_cache,
+			max_bytes=OCR.get("batch_max_bytes", 18 * 1024 * 1024),
+			reports=uploads,
+			backend=get_backend(),
+		)
+	except Exception as e:
+		print(f"❌ OCR error for batch {fnames[0]}..{fnames[-1]}: {e}")
+		traceback.print_exc()
+		ms = round((time.perf_counter() - start) * 1000 / len(fnames), 1)
+		return [(f, None, str(e), ms, u) for f, u in zip(fnames, uploads)]
+	ms = round((time.perf_counter() - start) * 1000 / len(fnames), 1)
+	print(f"✅ OCR completed for {len(fnames)} pages in one batch ({ms * len(fnames) / 1000:.1f}s)")
+	return [(f, out or None, None if out else "no rows returned", ms, u) for f, out, u in zip(fnames, out_csvs, uploads)]
+
 
+def _run_ocr(job: Job, run_dir: str, image_files: List[str], api_key: str, csv_urls: dict, force: bool = False) -> dict:
+	"""
+	Background body of /ocr-batch: filter, OCR and parse the cleaned pages of a
+	run. Pages with a current checkpoint are not sent again unless force is set.
+	"""
+	cleaned_dir = os.path.join(run_dir, 'cleaned')
 	csv_dir = os.path.join(run_dir, 'csv')
 	os.makedirs(csv_dir, exist_ok=True)
+	# Preprocess page of each image (cleaned_NN is page NN), so events and checkpoints keep it after filtering
+	indexed = {os.path.basename(p['clean_path']): p['page'] for p in run_index.pages(job.run_id) if p.get('clean_path')}
+	page_numbers = {fname: indexed.get(fname, n) for n, fname in enumerate(image_files, start=1)}
 
-	api_key = os.getenv('GEMINI_API_KEY')
-	if not api_key:
-		flash('GEMINI_API_KEY not found in environment. Please check your .env file.', 'error')
-		return redirect(url_for('dashboard'))
-	
-	print(f"🔑 API key found: {api_key[:10]}...")
-	results = []
-	files_list = sorted(os.listdir(cleaned_dir))
-	print(f"📝 Found {len(files_list)} files in cleaned directory")
-	
-	import shutil
-	for fname in files_list:
-		if not fname.lower().endswith(('.png', '.jpg', '.jpeg')):
-			continue
-		image_path = os.path.join(cleaned_dir, fname)
-		csv_name = os.path.splitext(fname)[0] + '.csv'
-		csv_path = os.path.join(csv_dir, csv_name)
+	# Drop blank backs and re-scanned sheets before paying for OCR
+	skipped = []
+	if PAGE_FILTER.get("enabled"):
+		verdicts = classify_pages(
+			[os.path.join(cleaned_dir, f) for f in image_files],
+			blank_ink_density=PAGE_FILTER["blank_ink_density"],
+			duplicate_max_distance=PAGE_FILTER["duplicate_max_distance"],
+		)
+		image_files = [os.path.basename(v['path']) for v in verdicts if v['status'] == 'ocr']
+		skipped = [
+			{
+				'title': os.path.basename(v['path']),
+				'reason': v['status'],
+				'duplicate_of': os.path.basename(v['duplicate_of']) if v['duplicate_of'] else None,
+				'ink': v['ink'],
+			}
+			for v in verdicts if v['status'] != 'ocr'
+		]
+		for sk in skipped:
+			print(f"⏭️ Skipping {sk['title']} ({sk['reason']}{' of ' + sk['duplicate_of'] if sk['duplicate_of'] else ''})")
 
-		print(f"🔄 Processing {fname}...")
+	job.set_total(len(image_files))
+	for fname in image_files:
+		job.page_update(page_numbers[fname], "queued", title=fname)
+
+	# A page whose image, model and prompt match its checkpoint keeps its CSV unless forced
+	checkpoints = {} if force else {r['title']: r for r in run_index.ocr_pages(job.run_id, status='done')}
+	cache_id = get_backend().cache_id(DEFAULT_MODEL)
+	fingerprints = {fname: ocr_fingerprint(os.path.join(cleaned_dir, fname), cache_id) for fname in image_files}
+	reused = [
+		fname for fname in image_files
+		if fname in checkpoints
+		and checkpoints[fname]['fingerprint'] == fingerprints[fname]
+		and os.path.isfile(checkpoints[fname]['csv_path'])
+	]
+
+	outcomes: dict = {}
+	failed = []
+
+	def finish(page: int, fname: str, out_csv: Optional[str], error: Optional[str], ocr_ms: Optional[float], upload: Optional[dict] = None, checkpoint: bool = False):
+		# Bytes of the page image on disk and as uploaded; absent when the result came from a cache
+		sizes = dict(source_bytes=upload.get('bytes_before'), upload_bytes=upload.get('bytes_after')) if upload else {}
+		if error:
+			failed.append(fname)
+			job.page_update(page, "error", title=fname, error=error, ocr_ms=ocr_ms, **sizes)
+			run_index.put_ocr(job.run_id, fname, "error", page=page, error=error, ocr_ms=ocr_ms, **sizes)
+			return
+		csv_name = os.path.basename(out_csv)
+		start = time.perf_counter()
 		try:
-			out_csv = gemini_ocr_extract(image_path, api_key=api_key, csv_path=csv_path)
-			print(f"✅ OCR completed for {fname}")
-			if not out_csv:
-				continue
-			# Copy CSV to uploads folder as attendance.csv (overwrite)
-			uploads_csv_path = os.path.join(UPLOAD_FOLDER, 'attendance.csv')
-			shutil.copyfile(out_csv, uploads_csv_path)
 			df = pd.read_csv(out_csv)
 			table_html = df.to_html(classes='table table-striped table-bordered', index=False)
-			results.append({
-				'image_url': '/' + os.path.join(cleaned_dir, fname).replace('\\', '/'),
-				'csv_name': csv_name,
-				'csv_url': url_for('download_csv_file', run_id=run_id, filename=csv_name),
-				'total_students': len(df),
-				'title': fname,
-				'table': table_html,
-			})
 		except Exception as e:
-			print(f"❌ OCR error for {fname}: {e}")
-			import traceback
-			traceback.print_exc()
-			continue
+			print(f"❌ Could not read OCR output for {fname}: {e}")
+			failed.append(fname)
+			job.page_update(page, "error", title=fname, error=f"unreadable CSV: {e}", ocr_ms=ocr_ms)
+			run_index.put_ocr(job.run_id, fname, "error", page=page, csv_path=out_csv, error=f"unreadable CSV: {e}", ocr_ms=ocr_ms)
+			return
+		result = {
+			'image_url': '/' + os.path.join(cleaned_dir, fname).replace('\\', '/'),
+			'csv_name': csv_name,
+			'csv_url': csv_urls.get(fname),
+			'total_students': len(df),
+			'title': fname,
+			'table': table_html,
+		}
+		outcomes[fname] = result
+		parse_ms = round((time.perf_counter() - start) * 1000, 1)
+		job.page_update(page, "done", ocr_ms=ocr_ms, parse_ms=parse_ms, checkpoint=checkpoint, **sizes, **result)
+		if checkpoint:
+			return
+		# Written as soon as the page is done, so a crashed batch resumes from here
+		run_index.put_ocr(
+			job.run_id,
+			fname,
+			"done",
+			page=page,
+			csv_path=out_csv.replace('\\', '/'),
+			rows=len(df),
+			ocr_ms=ocr_ms,
+			parse_ms=parse_ms,
+			fingerprint=fingerprints[fname],
+			**sizes,
+		)
+
+	for fname in reused:
+		print(f"♻️ Reusing checkpointed OCR for {fname}")
+		finish(page_numbers[fname], fname, checkpoints[fname]['csv_path'], None, None, checkpoint=True)
 
+	def work(group: List[Tuple[int, str]]):
+		for page, fname in group:
+			job.page_update(page, "running", title=fname)
+		# A forced re-run asks the API again rather than the result cache
+		return _ocr_pages(cleaned_dir, csv_dir, [fname for _, fname in group], api_key, use_cache=not force)
+
+	# Groups of pages are OCR'd concurrently and reported as they finish; results are kept in page order
+	pending = [(page_numbers[fname], fname) for fname in image_files if fname not in reused]
+	batch_size = max(1, OCR.get("batch_size", 1))
+	groups = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+	concurrency = max(1, min(OCR.get("concurrency", 4), len(groups) or 1))
+	print(f"🔄 OCR on {len(pending)} pages in {len(groups)} requests, {concurrency} at a time...")
+	with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="ocr") as executor:
+		futures = {executor.submit(work, group): group for group in groups}
+		for future in as_completed(futures):
+			for (page, _), (fname, out_csv, error, ocr_ms, upload) in zip(futures[future], future.result()):
+				finish(page, fname, out_csv, error, ocr_ms, upload)
+
+	results = [outcomes[fname] for fname in image_files if fname in outcomes]
 	print(f"🎉 OCR batch completed. {len(results)} results generated")
-	
 	if not results:
-		flash('OCR produced no results. Please verify API key and inputs.', 'error')
+		raise ValueError('OCR produced no results. Please verify API key and inputs.')
+
+	# Copy the last page's CSV to uploads folder as attendance.csv (overwrite)
+	shutil.copyfile(os.path.join(csv_dir, results[-1]['csv_name']), os.path.join(UPLOAD_FOLDER, 'attendance.csv'))
+
+	job.message('success', f'Successfully extracted data from {len(results)} images!')
+	if reused:
+		job.message('info', f'Reused {len(reused)} pages checkpointed by an earlier OCR run.')
+	failed = [f for f in image_files if f in failed]
+	if failed:
+		job.message('error', f'OCR failed for {len(failed)} pages: {", ".join(failed)}')
+	if skipped:
+		blank = sum(1 for sk in skipped if sk['reason'] == 'blank')
+		job.message('info', f'Skipped {len(skipped)} pages before OCR ({blank} blank, {len(skipped) - blank} duplicate).')
+	return dict(results=results, skipped=skipped, failed=failed)
+
+
+@app.route('/ocr-batch/<run_id>', methods=['POST'])
+def ocr_batch(run_id: str):
+	"""
+	Start OCR on all cleaned images for a given run in the background and show its
+	progress. POST only: OCR is paid per page, so following or prefetching a link
+	must never start it.
+	"""
+	run_dir = os.path.join(RUNS_DIR, run_id)
+	
+	print(f"🔍 OCR batch started for run_id: {run_id}")
+	run = _lookup_run(run_id)
+	clean_paths = run_index.clean_paths(run_id) if run else []
+	if not clean_paths:
+		flash('Invalid run. Please preprocess images first.', 'error')
 		return redirect(url_for('dashboard'))
 
-	flash(f'Successfully extracted data from {len(results)} images!', 'success')
+	api_key = os.getenv('GEMINI_API_KEY')
+	backend = get_backend()
+	if backend.needs_api_key and not api_key:
+		flash('GEMINI_API_KEY not found in environment. Please check your .env file.', 'error')
+		return redirect(url_for('dashboard'))
+	
+	if api_key:
+		print(f"🔑 API key found: {api_key[:10]}...")
+	print(f"🧩 OCR backend: {backend.name}")
+	job = jobs.get(run_id, kind='ocr')
+	if job is None or job.done:
+		image_files = [os.path.basename(p) for p in clean_paths]
+		print(f"📝 Found {len(image_files)} cleaned pages in the run index")
+		csv_urls = {
+			f: url_for('download_csv_file', run_id=run_id, filename=os.path.splitext(f)[0] + '.csv')
+			for f in image_files
+		}
+		force = request.form.get('force', '').lower() in ('1', 'true', 'yes')
+		jobs.submit(run_id, _run_ocr, run_dir, image_files, api_key, csv_urls, force=force, kind='ocr')
+	return redirect(url_for('ocr_view', run_id=run_id))
+
+
+@app.route('/runs/<run_id>/ocr', methods=['GET'])
+def ocr_view(run_id: str):
+	"""OCR dashboard for a run: tables appear page by page while OCR runs, the full results once it has finished."""
+	run = _lookup_run(run_id)
+	if run is None:
+		flash('Invalid run. Please preprocess images first.', 'error')
+		return redirect(url_for('dashboard'))
+	job = jobs.get(run_id, kind='ocr')
+	if job is None and not run_index.ocr_pages(run_id, status='done'):
+		# Nothing read yet: show the run with its "Run OCR" button rather than starting a paid job
+		flash('No OCR results for this run yet.', 'info')
+		return _render_saved_run(run_id)
 
 	# Load input and cleaned images for dashboard display
-	input_dir = os.path.join(run_dir, 'input')
-	cleaned_dir = os.path.join(run_dir, 'cleaned')
-	input_images = ['/' + os.path.join(input_dir, f).replace('\\', '/') for f in sorted(os.listdir(input_dir)) if f.lower().endswith(('.png', '.jpg', '.jpeg'))] if os.path.isdir(input_dir) else []
-	cleaned_images = ['/' + os.path.join(cleaned_dir, f).replace('\\', '/') for f in sorted(os.listdir(cleaned_dir)) if f.lower().endswith(('.png', '.jpg', '.jpeg'))] if os.path.isdir(cleaned_dir) else []
+	input_images = ['/' + p for p in run_index.input_paths(run_id)]
+	cleaned_images = ['/' + p for p in run_index.clean_paths(run_id)]
 
 	# Set metrics
 	metrics = dict(
 		uploaded=len(input_images),
 		processed=len(cleaned_images),
-		last_run=datetime.now().strftime("%d-%b %Y %I:%M %p"),
+		last_run=datetime.fromtimestamp(run['updated']).strftime("%d-%b %Y %I:%M %p"),
 	)
 
-	# Default settings (since not saved)
-	settings = dict(
-		resize_width=1500,
-		adaptive_block=35,
-		adaptive_c=5,
-		deskew=True,
-		crop_table=False,
-		remove_shadow=True,
-		clahe_clip=0,
-		denoise_strength=0
-	)
+	# Settings the run was preprocessed with
+	settings = dict(_default_settings(), **run['settings'])
+
+	if job is None:
+		# Finished before the server (re)started: rebuild the tables from the indexed CSVs
+		return render_template(
+			'dashboard.html',
+			app_name=APP_NAME,
+			results=_indexed_ocr_results(run_id),
+			run_id=run_id,
+			zip_url=url_for('download_csv_zip', run_id=run_id),
+			metrics=metrics,
+			input_images=input_images,
+			cleaned_images=cleaned_images,
+			settings=settings
+		)
+
+	if not job.done:
+		return render_template(
+			'dashboard.html',
+			app_name=APP_NAME,
+			ocr_job=job.snapshot(),
+			events_url=url_for('run_events', run_id=run_id, after=job.first_event_id),
+			run_id=run_id,
+			metrics=metrics,
+			input_images=input_images,
+			cleaned_images=cleaned_images,
+			settings=settings
+		)
+
+	for category, text in job.take_messages(failure='OCR failed.'):
+		flash(text, category)
+	if job.status == 'failed':
+		return redirect(url_for('dashboard'))
 
 	return render_template(
 		'dashboard.html',
 		app_name=APP_NAME,
-		results=results,
+		results=job.result['results'],
+		skipped=job.result['skipped'],
 		run_id=run_id,
 		zip_url=url_for('download_csv_zip', run_id=run_id),
 		metrics=metrics,
@@ -372,30 +1032,45 @@ def ocr_batch(run_id: str):
 	)
 
 
+def _indexed_ocr_results(run_id: str) -> List[dict]:
+	"""OCR result cards for a run, read back from the CSVs recorded in the run index."""
+	results = []
+	for rec in run_index.ocr_pages(run_id, status='done'):
+		try:
+			df = pd.read_csv(rec['csv_path'])
+		except Exception as e:
+			print(f"❌ Could not read OCR output for {rec['title']}: {e}")
+			continue
+		csv_name = os.path.basename(rec['csv_path'])
+		results.append({
+			'image_url': '/' + os.path.join(RUNS_DIR, run_id, 'cleaned', rec['title']).replace('\\', '/'),
+			'csv_name': csv_name,
+			'csv_url': url_for('download_csv_file', run_id=run_id, filename=csv_name),
+			'total_students': len(df),
+			'title': rec['title'],
+			'table': df.to_html(classes='table table-striped table-bordered', index=False),
+		})
+	return results
+
+
 @app.route('/download/csv/<run_id>/<path:filename>', methods=['GET'])
 def download_csv_file(run_id: str, filename: str):
 	"""Download a single CSV for a given run."""
-	csv_dir = os.path.join(RUNS_DIR, run_id, 'csv')
-	if not os.path.isfile(os.path.join(csv_dir, filename)):
-		return redirect(url_for('ocr_batch', run_id=run_id))
-	return send_from_directory(csv_dir, filename, as_attachment=True)
+	csv_paths = [r['csv_path'] for r in run_index.ocr_pages(run_id, status='done')] if _lookup_run(run_id) else []
+	matches = [p for p in csv_paths if os.path.basename(p) == filename and os.path.isfile(p)]
+	if not matches:
+		abort(404)
+	return send_from_directory(os.path.dirname(matches[0]), filename, as_attachment=True)
 
 
 @app.route('/download/csv-zip/<run_id>', methods=['GET'])
 def download_csv_zip(run_id: str):
 	"""Download a ZIP of all CSVs for a given run."""
-	csv_dir = os.path.join(RUNS_DIR, run_id, 'csv')
-	if not os.path.isdir(csv_dir):
-		return redirect(url_for('ocr_batch', run_id=run_id))
-	buffer = io.BytesIO()
-	with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zipf:
-		for fname in sorted(os.listdir(csv_dir)):
-			if not fname.lower().endswith('.csv'):
-				continue
-			fpath = os.path.join(csv_dir, fname)
-			zipf.write(fpath, arcname=fname)
-	buffer.seek(0)
-	return send_file(buffer, as_attachment=True, download_name=f'{run_id}_csvs.zip', mimetype='application/zip')
+	csv_paths = [r['csv_path'] for r in run_index.ocr_pages(run_id, status='done')] if _lookup_run(run_id) else []
+	csv_paths = [p for p in csv_paths if os.path.isfile(p)]
+	if not csv_paths:
+		abort(404)
+	return _zip_response(iter_zip((os.path.basename(p), p) for p in csv_paths), f'{run_id}_csvs.zip')
 
 
 if __name__ == "__main__":
@@ -0,0 +1,132 @@
+// Live progress for background runs, fed by /api/runs/<run_id>/events (server-sent events)
+
+function escapeHtml(text) {
+	var el = document.createElement("span");
+	el.textContent = text === undefined || text === null ? "" : String(text);
+	return el.innerHTML;
+}
+
+function formatBytes(n) {
+	if (typeof n !== "number") return "—";
+	return n >= 1048576 ? (n / 1048576).toFixed(1) + " MB" : (n / 1024).toFixed(0) + " KB";
+}
+
+function formatMs(ms) {
+	return typeof ms === "number" ? (ms >= 1000 ? (ms / 1000).toFixed(1) + " s" : ms.toFixed(0) + " ms") : "—";
+}
+
+// Subscribe to a run's events for one stage ("preprocess" or "ocr").
+// onPage(data) runs for every page event; the page reloads once the stage finishes
+// so the server renders the complete results.
+function watchRun(eventsUrl, stage, handlers) {
+	var source = new EventSource(eventsUrl);
+	var pages = {};
+	var total = null;
+
+	function update() {
+		var list = Object.keys(pages).map(function (k) { return pages[k]; });
+		var completed = list.filter(function (p) { return p.status === "done" || p.status === "error"; }).length;
+		if (handlers.onProgress) {
+			handlers.onProgress(completed, total === null ? list.length : total, total === null);
+		}
+	}
+
+	source.addEventListener("total", function (e) {
+		var data = JSON.parse(e.data);
+		if (data.stage !== stage) return;
+		total = data.total;
+		update();
+	});
+	source.addEventListener("page", function (e) {
+		var data = JSON.parse(e.data);
+		if (data.stage !== stage) return;
+		pages[data.page] = Object.assign(pages[data.page] || {}, data);
+		if (handlers.onPage) handlers.onPage(pages[data.page]);
+		update();
+	});
+	source.addEventListener("job", function (e) {
+		var data = JSON.parse(e.data);
+		if (data.stage !== stage) return;
+		if (handlers.onStatus) handlers.onStatus(data.status);
+		if (data.status === "done" || data.status === "failed") {
+			source.close();
+			window.location.reload();
+		}
+	});
+	return source;
+}
+
+function progressHandlers(box) {
+	return {
+		onStatus: function (status) {
+			box.querySelector("[data-role=status]").textContent = status;
+		},
+		onProgress: function (completed, total, partial) {
+			box.querySelector("[data-role=count]").textContent = completed + " / " + total + (partial ? "+" : "") + " pages";
+			box.querySelector("[data-role=bar]").style.width = (total ? 100 * completed / total : 0) + "%";
+		},
+	};
+}
+
+// Keep a table body with one row per page, in page order
+function upsertPageRow(tbody, page, cells) {
+	var row = tbody.querySelector('tr[data-page="' + page + '"]');
+	if (!row) {
+		row = document.createElement("tr");
+		row.className = "border-b border-gray-100";
+		row.dataset.page = page;
+		var next = Array.prototype.find.call(tbody.children, function (r) { return Number(r.dataset.page) > page; });
+		tbody.insertBefore(row, next || null);
+	}
+	row.innerHTML = cells.map(function (c) { return '<td class="py-2 pr-4">' + escapeHtml(c) + "</td>"; }).join("");
+}
+
+function watchPreprocess(box) {
+	var handlers = progressHandlers(box);
+	var tbody = box.querySelector("[data-role=pages]");
+	handlers.onPage = function (p) {
+		upsertPageRow(tbody, p.page, [
+			p.page,
+			p.source || "—",
+			p.status + (p.error ? " — " + p.error : ""),
+			p.cache === "hit" ? "cached" : formatMs(p.ms),
+			typeof p.deskew_angle === "number" ? p.deskew_angle.toFixed(2) : "—",
+		]);
+	};
+	watchRun(box.dataset.eventsUrl, "preprocess", handlers);
+}
+
+function watchOcr(box) {
+	var handlers = progressHandlers(box);
+	var tbody = box.querySelector("[data-role=pages]");
+	var tables = box.querySelector("[data-role=tables]");
+	var template = box.querySelector("template");
+	handlers.onPage = function (p) {
+		upsertPageRow(tbody, p.page, [
+			p.page,
+			p.title || "—",
+			p.status + (p.error ? " — " + p.error : ""),
+			formatMs(p.ocr_ms),
+			formatMs(p.parse_ms),
+			typeof p.upload_bytes === "number" ? formatBytes(p.source_bytes) + " → " + formatBytes(p.upload_bytes) : "—",
+		]);
+		if (p.status !== "done" || !p.table) return;
+		// Render the page's table as soon as it is parsed, in page order
+		var card = template.content.firstElementChild.cloneNode(true);
+		card.dataset.page = p.page;
+		card.querySelector("[data-role=title]").textContent = p.title;
+		card.querySelector("[data-role=students]").textContent = "Total Students: " + p.total_students;
+		card.querySelector("[data-role=csv]").href = p.csv_url;
+		card.querySelector("[data-role=table]").innerHTML = p.table;
+		var next = Array.prototype.find.call(tables.children, function (c) { return Number(c.dataset.page) > p.page; });
+		tables.insertBefore(card, next || null);
+	};
+	watchRun(box.dataset.eventsUrl, "ocr", handlers);
+}
+
+document.addEventListener("DOMContentLoaded", function () {
+	var pre = document.getElementById("job-progress");
+	if (pre) watchPreprocess(pre);
+	var ocr = document.getElementById("ocr-progress");
+	if (ocr) watchOcr(ocr);
+});
@@ -0,0 +1 @@
+"""Run storage modules for AudtiFlow"""
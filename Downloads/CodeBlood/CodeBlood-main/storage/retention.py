@@ -0,0 +1,235 @@
+import os
+import shutil
+import threading
+import time
+import zipfile
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+from storage.run_index import RunIndex
+from storage.zipstream import compression_for
+
+
+def _tree_size(path: str) -> int:
+	if os.path.isfile(path):
+		return os.path.getsize(path)
+	total = 0
+	for root, _, files in os.walk(path):
+		for f in files:
+			try:
+				total += os.path.getsize(os.path.join(root, f))
+			except OSError:
+				pass
+	return total
+
+
+class RunStorage:
+	"""
+	Keeps static/runs within bounds. Each sweep:
+
+	1. deletes runs older than max_age_days,
+	2. packs runs not touched for compact_after_days into a single <run_id>.zip
+	   (restored on the next access),
+	3. deletes the oldest runs until the total size is within max_bytes.
+
+	Runs for which is_active(run_id) is true, or that are held with hold(), are
+	never touched. Sweeps run on a daemon thread every interval_s seconds, so
+	requests never wait for them.
+	"""
+
+	def __init__(
+		self,
+		runs_dir: str,
+		index: RunIndex,
+		max_age_days: float = 30,
+		max_bytes: int = 0,
+		compact_after_days: float = 0,
+		interval_s: float = 3600,
+		is_active: Optional[Callable[[str], bool]] = None,
+		on_remove: Optional[Callable[[str], None]] = None,
+	):
+		self.runs_dir = runs_dir
+		self.index = index
+		self.max_age_s = max_age_days * 86400 if max_age_days else 0
+		self.max_bytes = max_bytes
+		self.compact_after_s = compact_after_days * 86400 if compact_after_days else 0
+		self.interval_s = interval_s
+		self.is_active = is_active or (lambda run_id: False)
+		self.on_remove = on_remove
+		self.last_report: Optional[dict] = None
+		self._sweep_lock = threading.Lock()
+		self._run_locks: Dict[str, threading.RLock] = {}
+		self._locks_lock = threading.Lock()
+		self._stop = threading.Event()
+		self._thread: Optional[threading.Thread] = None
+		self._start_lock = threading.Lock()
+
+	def _run_lock(self, run_id: str) -> threading.RLock:
+		with self._locks_lock:
+			return self._run_locks.setdefault(run_id, threading.RLock())
+
+	# Scheduling
+
+	def start(self) -> None:
+		"""Start the sweeper thread unless it is already running (safe to call from every request)."""
+		with self._start_lock:
+			if self._thread is None or not self._thread.is_alive():
+				self._stop.clear()
+				self._thread = threading.Thread(target=self._loop, name="run-storage", daemon=True)
+				self._thread.start()
+
+	def stop(self) -> None:
+		self._stop.set()
+
+	def _loop(self) -> None:
+		while not self._stop.is_set():
+			try:
+				self.sweep()
+			except Exception as e:
+				print(f"Run storage sweep failed: {e}")
+			self._stop.wait(self.interval_s)
+
+	# Single runs
+
+	def run_dir(self, run_id: str) -> str:
+		return os.path.join(self.runs_dir, run_id)
+
+	def remove(self, run_id: str) -> int:
+		"""Delete a run's directory, archive and index entry; returns the bytes freed."""
+		with self._run_lock(run_id):
+			run = self.index.get_run(run_id)
+			freed = 0
+			for path in [self.run_dir(run_id), run.get("archive") if run else None]:
+				if path and os.path.exists(path):
+					freed += _tree_size(path)
+					if os.path.isdir(path):
+						shutil.rmtree(path, ignore_errors=True)
+					else:
+						os.remove(path)
+			self.index.delete_run(run_id)
+		if self.on_remove:
+			self.on_remove(run_id)
+		return freed
+
+	def compact(self, run_id: str) -> int:
+		"""Pack a run directory into <run_id>.zip and delete the directory; returns the bytes saved."""
+		with self._run_lock(run_id):
+			run_dir = self.run_dir(run_id)
+			if not os.path.isdir(run_dir):
+				return 0
+			before = _tree_size(run_dir)
+			archive = run_dir + ".zip"
+			tmp = archive + ".tmp"
+			with zipfile.ZipFile(tmp, "w") as zf:
+				for root, _, files in os.walk(run_dir):
+					for f in sorted(files):
+						path = os.path.join(root, f)
+						arcname = os.path.relpath(path, run_dir).replace("\\", "/")
+						zf.write(path, arcname, compress_type=compression_for(arcname))
+			os.replace(tmp, archive)
+			self.index.set_archive(run_id, archive.replace("\\", "/"))
+			shutil.rmtree(run_dir, ignore_errors=True)
+			return before - os.path.getsize(archive)
+
+	def restore(self, run_id: str) -> bool:
+		"""Unpack an archived run back into its directory; True if the run's files are available."""
+		with self._run_lock(run_id):
+			run = self.index.get_run(run_id)
+			if run is None:
+				return False
+			archive = run.get("archive")
+			if not archive:
+				return os.path.isdir(self.run_dir(run_id))
+			if not os.path.isfile(archive):
+				return False
+			with zipfile.ZipFile(archive) as zf:
+				zf.extractall(self.run_dir(run_id))
+			os.remove(archive)
+			self.index.set_archive(run_id, None)
+			return True
+
+	@contextmanager
+	def hold(self, run_id: str) -> Iterator[bool]:
+		"""
+		Keep sweeps off a run while the caller writes into it. Yields whether the
+		run's files are available, unpacking it first if it was compacted.
+		"""
+		with self._run_lock(run_id):
+			yield self.restore(run_id)
+
+	# Sweeps
+
+	def sweep(self, now: Optional[float] = None) -> dict:
+		"""Apply the age, compaction and size rules once and return what was done."""
+		with self._sweep_lock:
+			now = now or time.time()
+			start = time.perf_counter()
+			self._import_unindexed()
+			report = dict(removed_age=[], compacted=[], removed_quota=[], freed_bytes=0)
+
+			runs = [r for r in self.index.oldest_runs() if not self._busy(r, now)]
+			kept: List[dict] = []
+			for run in runs:
+				if self.max_age_s and now - run["created"] > self.max_age_s:
+					freed = self._if_idle(run["run_id"], self.remove)
+					if freed is not None:
+						report["freed_bytes"] += freed
+						report["removed_age"].append(run["run_id"])
+				else:
+					kept.append(run)
+
+			if self.compact_after_s:
+				for run in kept:
+					if not run.get("archive") and now - run["updated"] > self.compact_after_s:
+						saved = self._if_idle(run["run_id"], self.compact)
+						if saved is not None:
+							report["freed_bytes"] += saved
+							report["compacted"].append(run["run_id"])
+
+			sizes = {r["run_id"]: self._disk_size(r["run_id"]) for r in kept}
+			total = sum(sizes.values()) + sum(self._disk_size(r["run_id"]) for r in self.index.oldest_runs() if self._busy(r, now))
+			if self.max_bytes:
+				for run in kept:
+					if total <= self.max_bytes:
+						break
+					freed = self._if_idle(run["run_id"], self.remove)
+					if freed is None:
+						continue
+					total -= sizes[run["run_id"]]
+					report["freed_bytes"] += freed
+					report["removed_quota"].append(run["run_id"])
+
+			report.update(
+				total_bytes=total,
+				max_bytes=self.max_bytes,
+				runs=len(kept) - len(report["removed_quota"]),
+				finished=now,
+				ms=round((time.perf_counter() - start) * 1000, 1),
+			)
+			self.last_report = report
+			return report
+
+	def _if_idle(self, run_id: str, action: Callable[[str], int]) -> Optional[int]:
+		"""action(run_id) under the run's lock, or None if a job took the run up after the sweep listed it."""
+		with self._run_lock(run_id):
+			if self.is_active(run_id):
+				return None
+			return action(run_id)
+
+	def _disk_size(self, run_id: str) -> int:
+		for path in (self.run_dir(run_id), self.run_dir(run_id) + ".zip"):
+			if os.path.exists(path):
+				return _tree_size(path)
+		return 0
+
+	def _busy(self, run: dict, now: float) -> bool:
+		# A "processing" run with no recent update was left behind by a crash and is fair game
+		return self.is_active(run["run_id"]) or (run["status"] == "processing" and now - run["updated"] < 86400)
+
+	def _import_unindexed(self) -> None:
+		# Directories left by older versions (or copied in by hand) count against the quota too
+		if not os.path.isdir(self.runs_dir):
+			return
+		for name in os.listdir(self.runs_dir):
+			if os.path.isdir(self.run_dir(name)) and self.index.get_run(name) is None:
+				self.index.import_run_dir(name, self.run_dir(name))
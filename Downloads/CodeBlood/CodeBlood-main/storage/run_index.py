@@ -0,0 +1,278 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterable, List, Optional
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+	run_id TEXT PRIMARY KEY,
+	created REAL NOT NULL,
+	updated REAL NOT NULL,
+	status TEXT NOT NULL,
+	settings TEXT NOT NULL DEFAULT '{}',
+	page_count INTEGER NOT NULL DEFAULT 0,
+	bytes INTEGER NOT NULL DEFAULT 0,
+	archive TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_created ON runs (created);
+
+CREATE TABLE IF NOT EXISTS pages (
+	run_id TEXT NOT NULL REFERENCES runs (run_id) ON DELETE CASCADE,
+	page INTEGER NOT NULL,
+	source TEXT,
+	input_path TEXT,
+	input_hash TEXT,
+	clean_path TEXT,
+	clean_hash TEXT,
+	bytes INTEGER NOT NULL DEFAULT 0,
+	ms REAL,
+	cache TEXT,
+	info TEXT NOT NULL DEFAULT '{}',
+	PRIMARY KEY (run_id, page)
+);
+
+CREATE TABLE IF NOT EXISTS ocr_pages (
+	run_id TEXT NOT NULL REFERENCES runs (run_id) ON DELETE CASCADE,
+	title TEXT NOT NULL,
+	page INTEGER,
+	status TEXT NOT NULL,
+	csv_path TEXT,
+	rows INTEGER,
+	error TEXT,
+	ocr_ms REAL,
+	parse_ms REAL,
+	fingerprint TEXT,
+	source_bytes INTEGER,
+	upload_bytes INTEGER,
+	updated REAL NOT NULL,
+	PRIMARY KEY (run_id, title)
+);
+"""
+
+# Per-page info keys that are stored in their own columns rather than in the info JSON
+_PAGE_COLUMNS = ("source", "input_path", "input_hash", "clean_path", "clean_hash", "bytes", "ms", "cache")
+
+
+def _dumps(value) -> str:
+	# Page info can carry numpy scalars (skew angle, grid coordinates)
+	return json.dumps(value, default=lambda o: o.item() if hasattr(o, "item") else str(o))
+
+
+def file_sha256(path: str) -> str:
+	h = hashlib.sha256()
+	with open(path, "rb") as f:
+		for block in iter(lambda: f.read(1 << 20), b""):
+			h.update(block)
+	return h.hexdigest()
+
+
+def _file_size(path: Optional[str]) -> int:
+	try:
+		return os.path.getsize(path) if path else 0
+	except OSError:
+		return 0
+
+
+class RunIndex:
+	"""
+	SQLite index of preprocessing runs: their settings, pages (paths, content
+	hashes, timings) and OCR artefacts, so routes look runs up by run_id instead
+	of listing directories under static/runs.
+	"""
+
+	def __init__(self, path: str):
+		self.path = str(path)
+		os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+		self._lock = threading.Lock()
+		self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+		self._conn.row_factory = sqlite3.Row
+		self._conn.execute("PRAGMA journal_mode=WAL")
+		self._conn.execute("PRAGMA foreign_keys=ON")
+		self._conn.executescript(SCHEMA)
+		self._migrate("runs", "archive", "TEXT")
+		self._migrate("ocr_pages", "fingerprint", "TEXT")
+		self._migrate("ocr_pages", "source_bytes", "INTEGER")
+		self._migrate("ocr_pages", "upload_bytes", "INTEGER")
+
+	def _migrate(self, table: str, column: str, decl: str) -> None:
+		# Databases created by earlier versions lack columns added since
+		columns = {r["name"] for r in self._conn.execute(f"PRAGMA table_info({table})")}
+		if column not in columns:
+			self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+	def _execute(self, sql: str, params: Iterable = ()) -> List[sqlite3.Row]:
+		with self._lock:
+			return self._conn.execute(sql, tuple(params)).fetchall()
+
+	# Runs
+
+	def create_run(self, run_id: str, settings: dict, status: str = "processing") -> None:
+		now = time.time()
+		self._execute(
+			"INSERT OR REPLACE INTO runs (run_id, created, updated, status, settings) VALUES (?, ?, ?, ?, ?)",
+			(run_id, now, now, status, _dumps(settings)),
+		)
+
+	def update_run(self, run_id: str, status: Optional[str] = None, settings: Optional[dict] = None) -> None:
+		"""Set the status and/or settings of a run and refresh its page count and size."""
+		with self._lock:
+			self._conn.execute("BEGIN")
+			try:
+				if status is not None:
+					self._conn.execute("UPDATE runs SET status = ? WHERE run_id = ?", (status, run_id))
+				if settings is not None:
+					self._conn.execute("UPDATE runs SET settings = ? WHERE run_id = ?", (_dumps(settings), run_id))
+				self._conn.execute(
+					"""UPDATE runs SET updated = ?,
+						page_count = (SELECT COUNT(*) FROM pages WHERE run_id = ?),
+						bytes = (SELECT COALESCE(SUM(bytes), 0) FROM pages WHERE run_id = ?)
+					WHERE run_id = ?""",
+					(time.time(), run_id, run_id, run_id),
+				)
+				self._conn.execute("COMMIT")
+			except Exception:
+				self._conn.execute("ROLLBACK")
+				raise
+
+	def set_archive(self, run_id: str, archive: Optional[str]) -> None:
+		"""Record that a run's files live in a packed archive (or, with None, back in its directory)."""
+		self._execute(
+			"UPDATE runs SET archive = ?, status = ?, updated = ? WHERE run_id = ?",
+			(archive, "archived" if archive else "done", time.time(), run_id),
+		)
+
+	def get_run(self, run_id: str) -> Optional[dict]:
+		rows = self._execute("SELECT * FROM runs WHERE run_id = ?", (run_id,))
+		return self._run_dict(rows[0]) if rows else None
+
+	def list_runs(self, limit: int = 50, offset: int = 0) -> List[dict]:
+		rows = self._execute("SELECT * FROM runs ORDER BY created DESC LIMIT ? OFFSET ?", (limit, offset))
+		return [self._run_dict(r) for r in rows]
+
+	def oldest_runs(self) -> List[dict]:
+		"""Every run, oldest first."""
+		return [self._run_dict(r) for r in self._execute("SELECT * FROM runs ORDER BY created")]
+
+	def delete_run(self, run_id: str) -> None:
+		self._execute("DELETE FROM runs WHERE run_id = ?", (run_id,))
+
+	@staticmethod
+	def _run_dict(row: sqlite3.Row) -> dict:
+		run = dict(row)
+		run["settings"] = json.loads(run["settings"] or "{}")
+		return run
+
+	# Pages
+
+	def put_page(self, run_id: str, page: int, **fields) -> None:
+		"""Insert or update one page; keys outside the page columns are merged into its info JSON."""
+		columns = {k: fields.pop(k) for k in _PAGE_COLUMNS if k in fields}
+		with self._lock:
+			row = self._conn.execute("SELECT * FROM pages WHERE run_id = ? AND page = ?", (run_id, page)).fetchone()
+			info = json.loads(row["info"]) if row else {}
+			info.update(fields)
+			columns["info"] = _dumps(info)
+			if "bytes" not in columns and ("input_path" in columns or "clean_path" in columns):
+				paths = [columns.get(k, row[k] if row else None) for k in ("input_path", "clean_path")]
+				columns["bytes"] = sum(_file_size(p) for p in paths)
+			if row is None:
+				names = ["run_id", "page", *columns]
+				self._conn.execute(
+					f"INSERT INTO pages ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})",
+					(run_id, page, *columns.values()),
+				)
+			else:
+				self._conn.execute(
+					f"UPDATE pages SET {', '.join(f'{k} = ?' for k in columns)} WHERE run_id = ? AND page = ?",
+					(*columns.values(), run_id, page),
+				)
+
+	def pages(self, run_id: str) -> List[dict]:
+		rows = self._execute("SELECT * FROM pages WHERE run_id = ? ORDER BY page", (run_id,))
+		pages = []
+		for row in rows:
+			page = dict(row)
+			page.update(json.loads(page.pop("info") or "{}"))
+			pages.append(page)
+		return pages
+
+	def input_paths(self, run_id: str) -> List[str]:
+		return [r["input_path"] for r in self._execute(
+			"SELECT input_path FROM pages WHERE run_id = ? AND input_path IS NOT NULL ORDER BY page", (run_id,)
+		)]
+
+	def clean_paths(self, run_id: str) -> List[str]:
+		return [r["clean_path"] for r in self._execute(
+			"SELECT clean_path FROM pages WHERE run_id = ? AND clean_path IS NOT NULL ORDER BY page", (run_id,)
+		)]
+
+	# OCR artefacts
+
+	def put_ocr(self, run_id: str, title: str, status: str, **fields) -> None:
+		self._execute(
+			"""INSERT OR REPLACE INTO ocr_pages
+				(run_id, title, page, status, csv_path, rows, error, ocr_ms, parse_ms, fingerprint, source_bytes, upload_bytes, updated)
+			VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+			(
+				run_id, title, fields.get("page"), status, fields.get("csv_path"), fields.get("rows"),
+				fields.get("error"), fields.get("ocr_ms"), fields.get("parse_ms"), fields.get("fingerprint"),
+				fields.get("source_bytes"), fields.get("upload_bytes"), time.time(),
+			),
+		)
+
+	def mark_ocr_stale(self, run_id: str, titles: Iterable[str]) -> None:
+		"""Retire the OCR results of pages whose cleaned image has changed, so they are neither shown nor reused."""
+		titles = list(titles)
+		if not titles:
+			return
+		self._execute(
+			f"UPDATE ocr_pages SET status = 'stale', updated = ? WHERE run_id = ? AND title IN ({', '.join('?' * len(titles))})",
+			(time.time(), run_id, *titles),
+		)
+
+	def ocr_pages(self, run_id: str, status: Optional[str] = None) -> List[dict]:
+		sql = "SELECT * FROM ocr_pages WHERE run_id = ?"
+		params: list = [run_id]
+		if status is not None:
+			sql += " AND status = ?"
+			params.append(status)
+		return [dict(r) for r in self._execute(sql + " ORDER BY title", params)]
+
+	# Runs written before the index existed
+
+	def import_run_dir(self, run_id: str, run_dir: str) -> Optional[dict]:
+		"""Index a run directory (input/, cleaned/, csv/) that has no entry yet; settings are unknown."""
+		clean_dir = os.path.join(run_dir, "cleaned")
+		if not os.path.isdir(clean_dir):
+			return None
+
+		def listing(sub: str, ext: tuple) -> List[str]:
+			d = os.path.join(run_dir, sub)
+			if not os.path.isdir(d):
+				return []
+			return [os.path.join(d, f).replace("\\", "/") for f in sorted(os.listdir(d)) if f.lower().endswith(ext)]
+
+		created = os.path.getmtime(run_dir)
+		with self._lock:
+			self._conn.execute(
+				"INSERT OR IGNORE INTO runs (run_id, created, updated, status, settings) VALUES (?, ?, ?, 'done', '{}')",
+				(run_id, created, created),
+			)
+		inputs = listing("input", (".png", ".jpg", ".jpeg"))
+		cleans = listing("cleaned", (".png", ".jpg", ".jpeg"))
+		for page in range(1, max(len(inputs), len(cleans)) + 1):
+			self.put_page(
+				run_id,
+				page,
+				input_path=inputs[page - 1] if page <= len(inputs) else None,
+				clean_path=cleans[page - 1] if page <= len(cleans) else None,
+			)
+		for csv_path in listing("csv", (".csv",)):
+			title = os.path.splitext(os.path.basename(csv_path))[0] + ".png"
+			self.put_ocr(run_id, title, "done", csv_path=csv_path)
+		self.update_run(run_id)
+		return self.get_run(run_id)
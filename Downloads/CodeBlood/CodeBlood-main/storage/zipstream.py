@@ -0,0 +1,79 @@
+import io
+import os
+import time
+import zipfile
+from typing import Callable, Iterable, Iterator, Tuple, Union
+
+
+# Formats that are already compressed; deflating them again costs CPU and saves nothing
+STORED_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp", ".gif", ".zip", ".gz", ".pdf"}
+
+# An entry source is a file path, the bytes themselves, or a callable that writes to a file object
+EntrySource = Union[str, bytes, Callable[[io.BufferedIOBase], None]]
+
+
+class _ChunkSink(io.RawIOBase):
+	"""Write-only, non-seekable sink that hands written bytes back to the generator."""
+
+	def __init__(self):
+		self._chunks = []
+		self._size = 0
+
+	def writable(self) -> bool:
+		return True
+
+	def write(self, b) -> int:
+		self._chunks.append(bytes(b))
+		self._size += len(b)
+		return len(b)
+
+	def tell(self) -> int:
+		return self._size
+
+	def drain(self) -> Iterator[bytes]:
+		if self._chunks:
+			data = b"".join(self._chunks)
+			self._chunks.clear()
+			yield data
+
+
+def compression_for(arcname: str) -> int:
+	return zipfile.ZIP_STORED if os.path.splitext(arcname)[1].lower() in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+
+
+def iter_zip(entries: Iterable[Tuple[str, EntrySource]], chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+	"""
+	Build a ZIP archive of (arcname, source) entries and yield it piece by piece
+	as it is written, so a response can start before the archive is complete and
+	no more than about one chunk is held in memory. Because the sink cannot seek,
+	zipfile writes each entry's sizes and CRC in a data descriptor after its data.
+	"""
+	sink = _ChunkSink()
+	with zipfile.ZipFile(sink, "w") as zf:
+		for arcname, source in entries:
+			if isinstance(source, str):
+				info = zipfile.ZipInfo.from_file(source, arcname)
+			else:
+				info = zipfile.ZipInfo(arcname, date_time=time.localtime()[:6])
+			info.compress_type = compression_for(arcname)
+			with zf.open(info, "w") as dest:
+				if isinstance(source, str):
+					with open(source, "rb") as src:
+						for block in iter(lambda: src.read(chunk_size), b""):
+							dest.write(block)
+							yield from sink.drain()
+				elif isinstance(source, (bytes, bytearray)):
+					dest.write(source)
+				else:
+					source(dest)
+			yield from sink.drain()
+	yield from sink.drain()
+
+
+def iter_zip_directory(directory: str, extensions: Tuple[str, ...] = ()) -> Iterator[bytes]:
+	"""Stream the files directly inside directory (optionally only those with the given extensions), sorted by name."""
+	names = sorted(
+		f for f in os.listdir(directory)
+		if os.path.isfile(os.path.join(directory, f)) and (not extensions or f.lower().endswith(extensions))
+	)
+	return iter_zip((name, os.path.join(directory, name)) for name in names)
@@ -0,0 +1,88 @@
+"""
+Retry, Retry-After, keep-alive and adaptive concurrency of the Gemini client,
+checked against the local mock server (no network, no API key).
+
+Run with: python -m pytest test_ocr_client.py
+"""
+import socket
+import time
+
+import pytest
+
+from ocr.client import GeminiClient, GeminiError
+from ocr.mock_server import MockGeminiServer
+from ocr.ratelimit import AIMDController, RateLimiter
+
+PAYLOAD = {"contents": [{"role": "user", "parts": [{"text": "Extract the attendance table"}]}]}
+
+
+def make_client(base_url: str, limiter: RateLimiter, max_retries: int = 4) -> GeminiClient:
+    # Computed backoff is kept tiny so any real wait comes from Retry-After
+    return GeminiClient(base_url=base_url, max_retries=max_retries, backoff_base=0.01, backoff_max=0.01, limiter=limiter)
+
+
+def make_limiter(initial: float = 4) -> RateLimiter:
+    return RateLimiter(concurrency=AIMDController(initial=initial, minimum=1, maximum=16))
+
+
+def test_retries_honour_retry_after_and_reuse_the_connection():
+    limiter = make_limiter()
+    with MockGeminiServer(script=[(429, "1"), (503, None), (200, None)]) as server:
+        client = make_client(server.base_url, limiter)
+        start = time.monotonic()
+        data = client.generate_content("gemini-test", PAYLOAD, "key")
+        elapsed = time.monotonic() - start
+        stats = server.stats()
+
+    assert data["candidates"][0]["content"]["parts"][0]["text"]
+    assert client.stats["requests"] == 3
+    assert client.stats["retries"] == 2
+    assert client.stats["failures"] == 0
+    assert stats["statuses"] == {"200": 1, "429": 1, "503": 1}
+    # Retry-After: 1 on the 429 is waited out in full
+    assert elapsed >= 1.0
+    assert client.stats["wait_s"] >= 1.0
+    # All three attempts went over one keep-alive connection
+    assert stats["connections"] == 1
+
+
+def test_aimd_backs_off_on_throttles_and_grows_on_success():
+    limiter = make_limiter(initial=4)
+    with MockGeminiServer(script=[(429, "0"), (503, None), (200, None)]) as server:
+        make_client(server.base_url, limiter).generate_content("gemini-test", PAYLOAD, "key")
+
+    stats = limiter.stats()
+    # 4 -> 2 on the 429, 2 -> 1 on the 503 (a later attempt, so a new decrease), 1 -> 2 on the 200
+    assert stats["concurrency_decreases"] == 2
+    assert stats["server_throttles"] == 2
+    assert stats["concurrency_limit"] == pytest.approx(2.0)
+    assert stats["in_flight"] == 0
+    assert stats["queue_depth"] == 0
+
+
+def test_aimd_ignores_other_server_errors():
+    limiter = make_limiter(initial=4)
+    with MockGeminiServer(script=[(500, None), (502, None), (200, None)]) as server:
+        make_client(server.base_url, limiter).generate_content("gemini-test", PAYLOAD, "key")
+
+    stats = limiter.stats()
+    # Only the 200 counts: 4 + 1/4
+    assert stats["concurrency_decreases"] == 0
+    assert stats["concurrency_limit"] == pytest.approx(4.25)
+
+
+def test_aimd_ignores_connection_errors():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]  # Closed again before the client connects
+    limiter = make_limiter(initial=4)
+    client = make_client(f"http://127.0.0.1:{port}", limiter, max_retries=7)
+
+    with pytest.raises(GeminiError):
+        client.generate_content("gemini-test", PAYLOAD, "key")
+
+    stats = limiter.stats()
+    assert client.stats["requests"] == 8
+    assert stats["requests"] == 8
+    assert stats["concurrency_limit"] == pytest.approx(4.0)
+    assert stats["in_flight"] == 0